@@ -2,7 +2,7 @@ from enum import StrEnum
 from typing import Dict
 
 from graxpert.astroimage import AstroImage
-from graxpert.stretch import StretchParameters, calculate_mtf_stretch_parameters_for_image, stretch_all
+from graxpert.stretch import StretchParameters
 
 
 class ImageTypes(StrEnum):
@@ -36,59 +36,34 @@ class AstroImageRepository:
         if self.get(ImageTypes.Original) is None:
             return
 
-        stretches = []
+        # stretch parameters per image type, None for no stretch
+        all_mtf_stretch_params = {}
 
         if not stretch_params.do_stretch:
             for key, image in self.images.items():
                 if image is not None:
-                    stretches.append(image.img_array)
+                    all_mtf_stretch_params[key] = None
 
         else:
 
-            all_image_arrays = []
-            all_mtf_stretch_params = []
-
-            all_image_arrays.append(self.get(ImageTypes.Original).img_array)
-            all_mtf_stretch_params.append(calculate_mtf_stretch_parameters_for_image(stretch_params, self.get(ImageTypes.Original).img_array))
+            all_mtf_stretch_params[ImageTypes.Original] = self.get(ImageTypes.Original).get_mtf_stretch_parameters(stretch_params)
 
             if self.get(ImageTypes.Gradient_Corrected) is not None and self.get(ImageTypes.Background) is not None:
-                all_image_arrays.append(self.get(ImageTypes.Gradient_Corrected).img_array)
-                all_mtf_stretch_params.append(calculate_mtf_stretch_parameters_for_image(stretch_params, self.get(ImageTypes.Gradient_Corrected).img_array))
-
-                all_image_arrays.append(self.get(ImageTypes.Background).img_array)
-                all_mtf_stretch_params.append(all_mtf_stretch_params[0])
-
-            if self.get(ImageTypes.Deconvolved_Object_only) is not None and self.get(ImageTypes.Gradient_Corrected) is None:
-                all_image_arrays.append(self.get(ImageTypes.Deconvolved_Object_only).img_array)
-                all_mtf_stretch_params.append(all_mtf_stretch_params[0])
-
-            elif self.get(ImageTypes.Deconvolved_Object_only) is not None and self.get(ImageTypes.Gradient_Corrected) is not None:
-                all_image_arrays.append(self.get(ImageTypes.Deconvolved_Object_only).img_array)
-                all_mtf_stretch_params.append(all_mtf_stretch_params[1])
-
-            if self.get(ImageTypes.Deconvolved_Stars_only) is not None and self.get(ImageTypes.Gradient_Corrected) is None:
-                all_image_arrays.append(self.get(ImageTypes.Deconvolved_Stars_only).img_array)
-                all_mtf_stretch_params.append(all_mtf_stretch_params[0])
-
-            elif self.get(ImageTypes.Deconvolved_Stars_only) is not None and self.get(ImageTypes.Gradient_Corrected) is not None:
-                all_image_arrays.append(self.get(ImageTypes.Deconvolved_Stars_only).img_array)
-                all_mtf_stretch_params.append(all_mtf_stretch_params[1])
-
-            if self.get(ImageTypes.Denoised) is not None and self.get(ImageTypes.Gradient_Corrected) is None:
-                all_image_arrays.append(self.get(ImageTypes.Denoised).img_array)
-                all_mtf_stretch_params.append(all_mtf_stretch_params[0])
+                all_mtf_stretch_params[ImageTypes.Gradient_Corrected] = self.get(ImageTypes.Gradient_Corrected).get_mtf_stretch_parameters(stretch_params)
+                all_mtf_stretch_params[ImageTypes.Background] = all_mtf_stretch_params[ImageTypes.Original]
 
-            elif self.get(ImageTypes.Denoised) is not None and self.get(ImageTypes.Gradient_Corrected) is not None:
-                all_image_arrays.append(self.get(ImageTypes.Denoised).img_array)
-                all_mtf_stretch_params.append(all_mtf_stretch_params[1])
+            # the processed images are stretched like the gradient corrected image, if there is one, or else like the original image
+            if self.get(ImageTypes.Gradient_Corrected) is None:
+                reference_mtf_stretch_params = all_mtf_stretch_params[ImageTypes.Original]
+            else:
+                reference_mtf_stretch_params = all_mtf_stretch_params[ImageTypes.Gradient_Corrected]
 
-            stretches = stretch_all(all_image_arrays, all_mtf_stretch_params)
+            for key in [ImageTypes.Deconvolved_Object_only, ImageTypes.Deconvolved_Stars_only, ImageTypes.Denoised]:
+                if self.get(key) is not None:
+                    all_mtf_stretch_params[key] = reference_mtf_stretch_params
 
-        i = 0
-        for key, image in self.images.items():
-            if image is not None:
-                image.update_display_from_array(stretches[i], saturation)
-                i = i + 1
+        for key, mtf_stretch_params in all_mtf_stretch_params.items():
+            self.get(key).update_display_from_mtf(mtf_stretch_params, saturation)
 
     def crop_all(self, start_x: float, end_x: float, start_y: float, end_y: float):
         for key, astroimg in self.images.items():
@@ -2,7 +2,9 @@ import logging
 import os
 import re
 import shutil
+import threading
 import zipfile
+from collections import OrderedDict
 
 import onnxruntime as ort
 from appdirs import user_data_dir
@@ -196,3 +198,71 @@ def get_execution_providers_ordered(gpu_acceleration=True):
             if provider in ort.get_available_providers():
                 result.append(provider)
     return result
+
+
+# inference session cache
+# creating an onnxruntime InferenceSession (graph optimization, provider setup) can take longer than the inference itself,
+# so sessions are kept alive and reused across background extraction, denoising and deconvolution calls
+max_cached_inference_sessions = 4
+max_cached_inference_sessions_bytes = 2 * 1024**3
+
+cached_inference_sessions = OrderedDict()
+cached_inference_sessions_lock = threading.Lock()
+
+
+def session_options_key(session_options):
+    if session_options is None:
+        return None
+
+    return (
+        session_options.graph_optimization_level,
+        session_options.execution_mode,
+        session_options.intra_op_num_threads,
+        session_options.inter_op_num_threads,
+        session_options.enable_mem_pattern,
+        session_options.enable_cpu_mem_arena,
+    )
+
+
+def inference_session_key(ai_path, providers, session_options=None):
+    ai_path = os.path.abspath(ai_path)
+    # include modification time so that a re-downloaded model is not served from a stale session
+    mtime = os.path.getmtime(ai_path) if os.path.isfile(ai_path) else None
+    return (ai_path, mtime, repr(providers), session_options_key(session_options))
+
+
+def get_inference_session(ai_path, providers, session_options=None):
+    key = inference_session_key(ai_path, providers, session_options)
+
+    with cached_inference_sessions_lock:
+        if key in cached_inference_sessions:
+            cached_inference_sessions.move_to_end(key)
+            logging.info(f"Reusing cached inference session for {ai_path}")
+            return cached_inference_sessions[key]["session"]
+
+    session = ort.InferenceSession(ai_path, sess_options=session_options, providers=providers)
+
+    # the size of the model file is used as an estimate of the memory held by the session
+    size = os.path.getsize(ai_path) if os.path.isfile(ai_path) else 0
+
+    with cached_inference_sessions_lock:
+        cached_inference_sessions[key] = {"session": session, "size": size}
+        cached_inference_sessions.move_to_end(key)
+        evict_inference_sessions()
+
+    return session
+
+
+def evict_inference_sessions():
+    total_size = sum(e["size"] for e in cached_inference_sessions.values())
+
+    # always keep the most recently used session
+    while len(cached_inference_sessions) > 1 and (len(cached_inference_sessions) > max_cached_inference_sessions or total_size > max_cached_inference_sessions_bytes):
+        key, entry = cached_inference_sessions.popitem(last=False)
+        total_size -= entry["size"]
+        logging.info(f"Evicting cached inference session for {key[0]}")
+
+
+def clear_inference_sessions():
+    with cached_inference_sessions_lock:
+        cached_inference_sessions.clear()
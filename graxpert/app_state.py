@@ -1,10 +1,67 @@
-from dataclasses import dataclass, field
-from typing import List
+import numpy as np
+
+from graxpert.point_index import PointIndex
 
 
-@dataclass
 class AppState:
-    background_points: List = field(default_factory=list)
+    """
+    State shared by the commands: the background points as an (N,3) int32 array of (x, y, 1) rows, stored in a buffer
+    that grows geometrically so that adding points is amortized O(1), and their spatial index. The commands change the
+    state in place and remember what they changed, so executing, undoing and redoing a command costs O(changed points).
+    Removing a point moves the last point into its place.
+    """
+
+    def __init__(self, background_points=None):
+        self.background_points = [] if background_points is None else background_points
+
+    @property
+    def background_points(self):
+        return self.points[: self.num_points]
+
+    @background_points.setter
+    def background_points(self, background_points):
+        self.points = np.array(background_points, dtype=np.int32).reshape(-1, 3)
+        self.num_points = len(self.points)
+        self.point_index = PointIndex(self.points)
+
+    def add_points(self, points):
+        points = np.asarray(points).reshape(-1, 3)
+        end = self.num_points + len(points)
+        if end > len(self.points):
+            buffer = np.empty((max(end, 2 * len(self.points), 16), 3), dtype=np.int32)
+            buffer[: self.num_points] = self.background_points
+            self.points = buffer
+        self.points[self.num_points : end] = points
+        for p in self.points[self.num_points : end]:
+            self.point_index.add(p)
+        self.num_points = end
+
+    def remove_point(self, idx):
+        # returns the removed point; the last point takes its place
+        removed = self.points[idx].copy()
+        self.num_points -= 1
+        self.points[idx] = self.points[self.num_points]
+        self.point_index.remove(idx)
+        return removed
+
+    def remove_last_points(self, count):
+        for _ in range(count):
+            self.remove_point(self.num_points - 1)
+
+    def restore_point(self, idx, point):
+        # inverse of remove_point
+        if idx == self.num_points:
+            self.add_points(point)
+        else:
+            self.add_points(self.points[idx].copy())
+            self.move_point(idx, point)
+
+    def move_point(self, idx, point):
+        # returns the previous position of the point
+        previous = self.points[idx].copy()
+        self.points[idx] = point
+        self.point_index.move(idx, self.points[idx])
+        return previous
 
 
 INITIAL_STATE = AppState()
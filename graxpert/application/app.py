@@ -150,10 +150,9 @@ class GraXpert:
 
         progress = DynamicProgressThread(callback=lambda p: eventbus.emit(AppEvents.CALCULATE_PROGRESS, {"progress": p}))
 
-        downscale_factor = 1
-
-        if self.prefs.interpol_type_option == "Kriging" or self.prefs.interpol_type_option == "RBF":
-            downscale_factor = 4
+        # without a fixed factor, the resolution at which the background model is evaluated is chosen from the image size
+        # and sample spacing
+        downscale_factor = self.prefs.downscale_factor
 
         try:
             self.prefs.images_linked_option = False
@@ -175,6 +174,11 @@ class GraXpert:
                     ai_model_path_from_version(bge_ai_models_dir, self.prefs.bge_ai_version),
                     progress,
                     self.prefs.ai_gpu_acceleration,
+                    self.prefs.RBF_tolerance,
+                    self.prefs.interpol_block_size,
+                    self.prefs.interpol_workers,
+                    self.prefs.kriging_neighbors,
+                    self.prefs.spline_knots,
                 )
             )
 
@@ -527,7 +531,7 @@ class GraXpert:
 
         try:
             if self.prefs.saveas_stretched:
-                self.images.get(self.display_type).save_stretched(dir, self.prefs.saveas_option, StretchParameters(self.prefs.stretch_option, self.prefs.channels_linked_option))
+                self.images.get(self.display_type).save_stretched(dir, self.prefs.saveas_option, StretchParameters(self.prefs.stretch_option, self.prefs.channels_linked_option), self.prefs.stretch_backend)
             else:
                 self.images.get(self.display_type).save(dir, self.prefs.saveas_option)
 
@@ -577,20 +581,9 @@ class GraXpert:
 
         background_points = self.cmd.app_state.background_points
 
-        min_idx = -1
-        min_dist = -1
-
-        for i in range(len(background_points)):
-            x_im = background_points[i][0]
-            y_im = background_points[i][1]
-
-            dist = np.max(np.abs([x_im - eventx_im, y_im - eventy_im]))
-
-            if min_idx == -1 or dist < min_dist:
-                min_dist = dist
-                min_idx = i
+        min_idx = self.cmd.app_state.point_index.nearest(eventx_im, eventy_im, self.prefs.sample_size)
 
-        if min_idx != -1 and min_dist <= self.prefs.sample_size:
+        if min_idx != -1:
             point = background_points[min_idx]
             self.cmd = Command(RM_POINT_HANDLER, self.cmd, idx=min_idx, point=point)
             self.cmd.execute()
@@ -1,3 +1,5 @@
+import itertools
+from dataclasses import astuple
 import json
 import logging
 import os
@@ -10,15 +12,22 @@ from skimage.util import img_as_uint
 from xisf import XISF
 
 from graxpert.app_state import AppState
+from graxpert.display_pyramid import DisplayPyramid
 from graxpert.preferences import Prefs, app_state_2_fitsheader
-from graxpert.stretch import stretch, StretchParameters
+from graxpert.stretch import calculate_mtf_stretch_parameters_from_histograms, channel_histograms, display_stretch, quantize, stretch, StretchParameters
+
+# distinguishes the pixel data of all images, see AstroImage.display_key
+pixels_versions = itertools.count()
 
 
 class AstroImage:
     def __init__(self, do_update_display=True):
         self.img_array = None
+        self.img_quantized = None
+        self.histograms = None
         self.img_display = None
         self.img_display_saturated = None
+        self.display_pyramid = None
         self.img_format = None
         self.fits_header = None
         self.xisf_metadata = {}
@@ -27,6 +36,10 @@ class AstroImage:
         self.width = 0
         self.height = 0
         self.roworder = "BOTTOM-UP"
+        self.grid_medians = {}
+        self.pixels_version = next(pixels_versions)
+        self.stretch_key = None
+        self.saturation = None
 
     def set_from_file(self, directory: str, stretch_params: StretchParameters, saturation: float):
         self.img_format = os.path.splitext(directory)[1].lower()
@@ -71,8 +84,12 @@ class AstroImage:
             img_array = exposure.rescale_intensity(img_array, out_range=(0, 1))
 
         self.img_array = img_array
+        self.img_quantized = None
+        self.histograms = None
         self.width = self.img_array.shape[1]
         self.height = self.img_array.shape[0]
+        self.grid_medians = {}
+        self.pixels_version = next(pixels_versions)
 
         if self.do_update_display:
             self.update_display(stretch_params, saturation)
@@ -81,22 +98,41 @@ class AstroImage:
 
     def set_from_array(self, array):
         self.img_array = array
+        self.img_quantized = None
+        self.histograms = None
         self.width = self.img_array.shape[1]
         self.height = self.img_array.shape[0]
+        self.grid_medians = {}
+        self.pixels_version = next(pixels_versions)
         return
 
     def update_display(self, stretch_params: StretchParameters, saturation: float):
-        img_display = self.stretch(stretch_params)
-        img_display = img_display * 255
+        mtf_stretch_params = None
+        if stretch_params.do_stretch:
+            mtf_stretch_params = self.get_mtf_stretch_parameters(stretch_params)
+
+        self.update_display_from_mtf(mtf_stretch_params, saturation)
+
+        return
+
+    def update_display_from_mtf(self, mtf_stretch_params, saturation):
+        # the display image is stretched with lookup tables on the quantized image; mtf_stretch_params holds the
+        # parameters per channel, or is None for no stretch
+        img_display = display_stretch(self.get_quantized(), mtf_stretch_params)
 
         # if self.roworder == "TOP-DOWN":
         #    img_display = np.flip(img_display, axis=0)
 
         if img_display.shape[2] == 1:
-            self.img_display = Image.fromarray(img_display[:, :, 0].astype(np.uint8))
+            self.img_display = Image.fromarray(img_display[:, :, 0])
         else:
-            self.img_display = Image.fromarray(img_display.astype(np.uint8))
+            self.img_display = Image.fromarray(img_display)
 
+        self.grid_medians = {}
+        if mtf_stretch_params is None:
+            self.stretch_key = "No Stretch"
+        else:
+            self.stretch_key = tuple(astuple(p) for p in mtf_stretch_params)
         self.update_saturation(saturation)
 
         return
@@ -112,22 +148,46 @@ class AstroImage:
         else:
             self.img_display = Image.fromarray(img_display.astype(np.uint8))
 
+        self.grid_medians = {}
+        # the stretch of img_display is unknown, so the display is never considered equal to a previous one
+        self.stretch_key = ("array", next(pixels_versions))
         self.update_saturation(saturation)
 
         return
 
-    def stretch(self, stretch_params: StretchParameters):
+    def get_quantized(self):
+        # 16 bit view of the image for the display, built on first use and kept until the image data changes
+        if self.img_quantized is None:
+            self.img_quantized = quantize(self.img_array)
+
+        return self.img_quantized
+
+    def get_mtf_stretch_parameters(self, stretch_params: StretchParameters):
+        # stretch parameters for the display from the channel histograms of the quantized image, which are built on
+        # first use and kept until the image data changes
+        if self.histograms is None:
+            self.histograms = channel_histograms(self.get_quantized())
+
+        return calculate_mtf_stretch_parameters_from_histograms(stretch_params, self.histograms)
+
+    def stretch(self, stretch_params: StretchParameters, stretch_backend="threads"):
         if stretch_params.do_stretch:
-            return np.clip(stretch(self.img_array, stretch_params), 0.0, 1.0)
+            return np.clip(stretch(self.img_array, stretch_params, stretch_backend), 0.0, 1.0)
         else:
             return np.clip(self.img_array, 0.0, 1.0)
 
     def crop(self, startx, endx, starty, endy):
         self.img_array = self.img_array[starty:endy, startx:endx, :]
+        if self.img_quantized is not None:
+            self.img_quantized = self.img_quantized[starty:endy, startx:endx, :]
+        self.histograms = None
         self.img_display = self.img_display.crop((startx, starty, endx, endy))
         self.img_display_saturated = self.img_display_saturated.crop((startx, starty, endx, endy))
+        self.display_pyramid = None
         self.width = self.img_array.shape[1]
         self.height = self.img_array.shape[0]
+        self.grid_medians = {}
+        self.pixels_version = next(pixels_versions)
         return
 
     def update_fits_header(self, original_header, background_mean, prefs: Prefs, app_state: AppState):
@@ -175,14 +235,14 @@ class AstroImage:
 
         return
 
-    def save_stretched(self, dir, saveas_type, stretch_params):
+    def save_stretched(self, dir, saveas_type, stretch_params, stretch_backend="threads"):
         if self.img_array is None:
             return
 
         if self.fits_header is not None:
             self.fits_header["STRETCH"] = stretch_params.stretch_option
 
-        stretched_img = self.stretch(stretch_params)
+        stretched_img = self.stretch(stretch_params, stretch_backend)
 
         if saveas_type == "16 bit Tiff" or saveas_type == "16 bit Fits" or saveas_type == "16 bit XISF":
             image_converted = img_as_uint(stretched_img)
@@ -229,6 +289,13 @@ class AstroImage:
 
             return L
 
+    def get_display_pyramid(self):
+        # mip-map pyramid of the saturated display image, built on first use and kept until the display image changes
+        if self.display_pyramid is None and self.img_display_saturated is not None:
+            self.display_pyramid = DisplayPyramid(self.img_display_saturated)
+
+        return self.display_pyramid
+
     def copy_metadata(self, source_img):
         self.xisf_metadata = source_img.xisf_metadata
         self.image_metadata = source_img.image_metadata
@@ -240,8 +307,15 @@ class AstroImage:
             self.img_display_saturated = ImageEnhance.Color(self.img_display)
             self.img_display_saturated = self.img_display_saturated.enhance(saturation)
 
+        self.saturation = saturation
+        self.display_pyramid = None
         return
 
+    @property
+    def display_key(self):
+        # identifies the display image: the pixel data, the stretch and the saturation it was rendered with
+        return (self.pixels_version, self.stretch_key, self.saturation)
+
     def update_xisf_imagedata(self):
         unique_keys = list(dict.fromkeys(self.fits_header.keys()))
 
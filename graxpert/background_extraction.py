@@ -3,20 +3,34 @@ import multiprocessing
 multiprocessing.freeze_support()
 
 import logging
-from concurrent.futures import wait
+import warnings
+from concurrent.futures import FIRST_COMPLETED, wait
 from multiprocessing import shared_memory
 
 import cv2
 import numpy as np
-import onnxruntime as ort
-from astropy.stats import sigma_clipped_stats
-from pykrige.ok import OrdinaryKriging
-from scipy import interpolate, linalg
+from scipy import interpolate, linalg, spatial
 
-from graxpert.ai_model_handling import get_execution_providers_ordered
+from graxpert.ai_model_handling import get_execution_providers_ordered, get_inference_session
+from graxpert.grid_utils import footprints
+from graxpert.kriging import OrdinaryKrigingInterpolation
 from graxpert.mp_logging import get_logging_queue, worker_configurer
-from graxpert.parallel_processing import executor
+from graxpert.parallel_processing import executor, max_workers
 from graxpert.radialbasisinterpolation import RadialBasisInterpolation
+from graxpert.tensor_spline import TensorProductSpline
+
+
+# Automatic downscale factor: the background model is evaluated with about 'samples_per_spacing' pixels per typical
+# distance between sample points, on an image of at least 'min_downscaled_size' pixels on its shorter side. The
+# upsampled model may deviate from the model at the sample points by at most 'max_upsampling_error' times its range,
+# otherwise the factor is reduced assuming the error of the linear upsampling grows with the square of the factor.
+samples_per_spacing = 16
+min_downscaled_size = 64
+max_downscale_factor = 32
+max_upsampling_error = 2e-3
+
+# Memory budget (in bytes) for the stack of sample footprints that are sigma clipped together in calc_mode_dataset
+max_footprint_bytes = 128 * 1024**2
 
 
 def gaussian_kernel(sigma=1.0, truncate=4.0):  # follow simulate skimage.filters.gaussian defaults
@@ -24,7 +38,7 @@ def gaussian_kernel(sigma=1.0, truncate=4.0):  # follow simulate skimage.filters
     return (ksize, ksize)
 
 
-def extract_background(in_imarray, background_points, interpolation_type, smoothing, downscale_factor, sample_size, RBF_kernel, spline_order, corr_type, ai_path, progress=None, ai_gpu_acceleration=True):
+def extract_background(in_imarray, background_points, interpolation_type, smoothing, downscale_factor, sample_size, RBF_kernel, spline_order, corr_type, ai_path, progress=None, ai_gpu_acceleration=True, RBF_tolerance=0.0, block_size=None, num_workers=None, kriging_neighbors=None, spline_knots=None):
 
     num_colors = in_imarray.shape[-1]
 
@@ -33,87 +47,28 @@ def extract_background(in_imarray, background_points, interpolation_type, smooth
 
     if interpolation_type == "AI":
         imarray = np.ndarray(in_imarray.shape, dtype=np.float32)
-        background = np.ndarray(in_imarray.shape, dtype=np.float32)
         np.copyto(imarray, in_imarray)
 
-        # Shrink and pad to avoid artifacts on borders
-        padding = 8
-        imarray_shrink = cv2.resize(imarray, dsize=(256 - 2 * padding, 256 - 2 * padding), interpolation=cv2.INTER_LINEAR)
-        
-        if len(imarray_shrink.shape) == 2:
-            imarray_shrink = np.expand_dims(imarray_shrink, -1)
-        
-        imarray_shrink = np.pad(imarray_shrink, ((padding, padding), (padding, padding), (0, 0)), mode="edge")
-
-        median = []
-        mad = []
+        imarray_shrink, median, mad = ai_shrink_and_normalize(imarray)
 
         if progress is not None:
-            progress.update(8)
-
-        for c in range(num_colors):
-            median.append(np.median(imarray_shrink[:, :, c]))
-            mad.append(np.median(np.abs(imarray_shrink[:, :, c] - median[c])))
-
-        if progress is not None:
-            progress.update(8)
-
-        imarray_shrink = (imarray_shrink - median) / mad * 0.04
-        imarray_shrink = np.clip(imarray_shrink, -1.0, 1.0)
-
-        if progress is not None:
-            progress.update(8)
-
-        if num_colors == 1:
-            imarray_shrink = np.array([imarray_shrink[:, :, 0], imarray_shrink[:, :, 0], imarray_shrink[:, :, 0]])
-            imarray_shrink = np.moveaxis(imarray_shrink, 0, -1)
-
-        if progress is not None:
-            progress.update(8)
+            progress.update(32)
 
         providers = get_execution_providers_ordered(ai_gpu_acceleration)
-        session = ort.InferenceSession(ai_path, providers=providers)
+        session = get_inference_session(ai_path, providers)
 
         logging.info(f"Providers : {providers}")
         logging.info(f"Used providers : {session.get_providers()}")
 
         background = session.run(None, {"gen_input_image": np.expand_dims(imarray_shrink, axis=0)})[0][0]
 
-        background = background / 0.04 * mad + median
-
         if progress is not None:
             progress.update(8)
 
-        if smoothing != 0:
-            sigma = smoothing * 20
-            background = cv2.GaussianBlur(background, ksize=gaussian_kernel(sigma), sigmaX=sigma, sigmaY=sigma)
+        background = ai_background_to_full_size(background, median, mad, smoothing, num_colors, in_imarray.shape)
 
         if progress is not None:
-            progress.update(8)
-
-        if num_colors == 1:
-            background = np.array([background[:, :, 0]])
-            background = np.moveaxis(background, 0, -1)
-
-        if progress is not None:
-            progress.update(8)
-
-        # Slice to unpadded size of shrinked image, then resize to original size
-        if padding != 0:
-            background = background[padding:-padding, padding:-padding, :]
-
-        if progress is not None:
-            progress.update(8)
-
-        sigma = 3.0
-        background = cv2.GaussianBlur(background, ksize=gaussian_kernel(sigma), sigmaX=sigma, sigmaY=sigma)
-        background = cv2.resize(background, dsize=(in_imarray.shape[1], in_imarray.shape[0]), interpolation=cv2.INTER_LINEAR)
-        
-        if len(background.shape) == 2:
-            background = np.expand_dims(background, -1)
-
-        if progress is not None:
-            progress.update(8)
+            progress.update(32)
 
     else:
         shm_imarray = shared_memory.SharedMemory(create=True, size=in_imarray.nbytes)
@@ -125,53 +80,69 @@ def extract_background(in_imarray, background_points, interpolation_type, smooth
         x_sub = np.array(background_points[:, 0], dtype=int)
         y_sub = np.array(background_points[:, 1], dtype=int)
 
+        auto_downscale = downscale_factor is None
+        if auto_downscale:
+            downscale_factor = auto_downscale_factor(in_imarray.shape[:2], x_sub, y_sub)
+            logging.info(f"Using downscale factor {downscale_factor}")
+
         if progress is not None:
             progress.update(24)
 
-        futures = []
-        logging_queue = get_logging_queue()
-        for c in range(num_colors):
-            futures.insert(
-                c,
-                executor.submit(
-                    interpol,
-                    shm_imarray.name,
-                    shm_background.name,
-                    c,
-                    x_sub,
-                    y_sub,
-                    in_imarray.shape,
-                    interpolation_type,
-                    smoothing,
-                    downscale_factor,
-                    sample_size,
-                    RBF_kernel,
-                    spline_order,
-                    imarray.dtype,
-                    logging_queue,
-                    worker_configurer,
-                ),
-            )
-        wait(futures)
+        while True:
+            if interpolation_type == "RBF" or interpolation_type == "Kriging":
+                model_at_samples = interpol_global(imarray, background, x_sub, y_sub, interpolation_type, smoothing, downscale_factor, sample_size, RBF_kernel, RBF_tolerance, block_size, num_workers, kriging_neighbors)
+
+            elif interpolation_type == "Splines" and spline_knots:
+                model_at_samples = interpol_lsq_spline(imarray, background, x_sub, y_sub, smoothing, downscale_factor, sample_size, spline_order, spline_knots)
+
+            else:
+                futures = []
+                logging_queue = get_logging_queue()
+                for c in range(num_colors):
+                    futures.insert(
+                        c,
+                        executor.submit(
+                            interpol,
+                            shm_imarray.name,
+                            shm_background.name,
+                            c,
+                            x_sub,
+                            y_sub,
+                            in_imarray.shape,
+                            interpolation_type,
+                            smoothing,
+                            downscale_factor,
+                            sample_size,
+                            RBF_kernel,
+                            spline_order,
+                            imarray.dtype,
+                            logging_queue,
+                            worker_configurer,
+                        ),
+                    )
+                wait(futures)
+                model_at_samples = [f.result() for f in futures]
+                model_at_samples = None if any(m is None for m in model_at_samples) else np.stack(model_at_samples, -1)
+
+            if not auto_downscale or downscale_factor == 1 or model_at_samples is None:
+                break
+
+            error = upsampling_error(background, x_sub, y_sub, model_at_samples)
+            if error <= max_upsampling_error:
+                break
+
+            reduced_factor = reduced_downscale_factor(downscale_factor, error)
+            logging.info(f"Upsampling error {error:.2e} too large for downscale factor {downscale_factor}, using downscale factor {reduced_factor}")
+            downscale_factor = reduced_factor
 
         if progress is not None:
             progress.update(48)
 
-    # Correction
-    if corr_type == "Subtraction":
-        mean = np.mean(background)
-        imarray[:, :, :] = imarray[:, :, :] - background[:, :, :] + mean
-    elif corr_type == "Division":
-        for c in range(num_colors):
-            mean = np.mean(imarray[:, :, c])
-            imarray[:, :, c] = imarray[:, :, c] / background[:, :, c] * mean
+    correct_image(imarray, background, corr_type)
 
     if progress is not None:
         progress.update(8)
 
-    # clip image
-    imarray[:, :, :] = imarray.clip(min=0.0, max=1.0)
-
     in_imarray[:] = imarray[:]
 
     if progress is not None:
@@ -188,24 +159,350 @@ def extract_background(in_imarray, background_points, interpolation_type, smooth
     return background
 
 
+def extract_background_ai_batch(in_imarrays, smoothing, corr_type, ai_path, batch_size=4, progress=None, ai_gpu_acceleration=True):
+    """
+    AI background extraction for a sequence of frames, e.g. calibrated sub-frames. The shrinked and normalized frames are
+    pushed through the model in batches of 'batch_size' so that the per-call overhead is shared by all frames of a batch.
+    Like extract_background, every array of 'in_imarrays' is corrected in place and the list of backgrounds is returned.
+    """
+
+    if batch_size < 1:
+        logging.info(f"mapping batch_size of {batch_size} to 1")
+        batch_size = 1
+
+    providers = get_execution_providers_ordered(ai_gpu_acceleration)
+    session = get_inference_session(ai_path, providers)
+
+    logging.info(f"Providers : {providers}")
+    logging.info(f"Used providers : {session.get_providers()}")
+
+    backgrounds = []
+    num_frames = len(in_imarrays)
+    last_progress = 0
+
+    for b in range(0, num_frames, batch_size):
+        batch = in_imarrays[b : b + batch_size]
+
+        imarrays = []
+        input_frames = []
+        params = []
+        for in_imarray in batch:
+            imarray = in_imarray.astype(np.float32, copy=True)
+            imarray_shrink, median, mad = ai_shrink_and_normalize(imarray)
+            imarrays.append(imarray)
+            input_frames.append(imarray_shrink)
+            params.append([median, mad])
+
+        session_result = session.run(None, {"gen_input_image": np.array(input_frames, dtype=np.float32)})[0]
+
+        for in_imarray, imarray, background, (median, mad) in zip(batch, imarrays, session_result, params):
+            background = ai_background_to_full_size(background, median, mad, smoothing, in_imarray.shape[-1], in_imarray.shape)
+            correct_image(imarray, background, corr_type)
+            in_imarray[:] = imarray[:]
+            backgrounds.append(background)
+
+        p = int(min(b + batch_size, num_frames) / num_frames * 100)
+        if p > last_progress:
+            if progress is not None:
+                progress.update(p - last_progress)
+            else:
+                logging.info(f"Progress: {p}%")
+            last_progress = p
+
+    return backgrounds
+
+
+def ai_shrink_and_normalize(imarray, padding=8):
+    num_colors = imarray.shape[-1]
+
+    # Shrink and pad to avoid artifacts on borders
+    imarray_shrink = cv2.resize(imarray, dsize=(256 - 2 * padding, 256 - 2 * padding), interpolation=cv2.INTER_LINEAR)
+
+    if len(imarray_shrink.shape) == 2:
+        imarray_shrink = np.expand_dims(imarray_shrink, -1)
+
+    imarray_shrink = np.pad(imarray_shrink, ((padding, padding), (padding, padding), (0, 0)), mode="edge")
+
+    median = []
+    mad = []
+
+    for c in range(num_colors):
+        median.append(np.median(imarray_shrink[:, :, c]))
+        mad.append(np.median(np.abs(imarray_shrink[:, :, c] - median[c])))
+
+    imarray_shrink = (imarray_shrink - median) / mad * 0.04
+    imarray_shrink = np.clip(imarray_shrink, -1.0, 1.0)
+
+    if num_colors == 1:
+        imarray_shrink = np.array([imarray_shrink[:, :, 0], imarray_shrink[:, :, 0], imarray_shrink[:, :, 0]])
+        imarray_shrink = np.moveaxis(imarray_shrink, 0, -1)
+
+    return imarray_shrink, median, mad
+
+
+def ai_background_to_full_size(background, median, mad, smoothing, num_colors, shape, padding=8):
+    background = background / 0.04 * mad + median
+
+    if smoothing != 0:
+        sigma = smoothing * 20
+        background = cv2.GaussianBlur(background, ksize=gaussian_kernel(sigma), sigmaX=sigma, sigmaY=sigma)
+
+    if num_colors == 1:
+        background = np.array([background[:, :, 0]])
+        background = np.moveaxis(background, 0, -1)
+
+    # Slice to unpadded size of shrinked image, then resize to original size
+    if padding != 0:
+        background = background[padding:-padding, padding:-padding, :]
+
+    sigma = 3.0
+    background = cv2.GaussianBlur(background, ksize=gaussian_kernel(sigma), sigmaX=sigma, sigmaY=sigma)
+    background = cv2.resize(background, dsize=(shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+
+    if len(background.shape) == 2:
+        background = np.expand_dims(background, -1)
+
+    return background
+
+
+def correct_image(imarray, background, corr_type):
+    num_colors = imarray.shape[-1]
+
+    if corr_type == "Subtraction":
+        mean = np.mean(background)
+        imarray[:, :, :] = imarray[:, :, :] - background[:, :, :] + mean
+    elif corr_type == "Division":
+        for c in range(num_colors):
+            mean = np.mean(imarray[:, :, c])
+            imarray[:, :, c] = imarray[:, :, c] / background[:, :, c] * mean
+
+    # clip image
+    imarray[:, :, :] = imarray.clip(min=0.0, max=1.0)
+
+
 def calc_mode_dataset(data, x_sub, y_sub, halfsize):
 
     n = x_sub.shape[0]
-    data_padded = np.pad(array=data, pad_width=(halfsize,), mode="reflect")
     subsample = np.zeros(n)
 
-    for i in range(n):
-        data_footprint = data_padded[y_sub[i] : y_sub[i] + 2 * halfsize, x_sub[i] : x_sub[i] + 2 * halfsize]
-        subsample[i] = sigma_clipped_stats(data=data_footprint, cenfunc="median", stdfunc="std", grow=4)[1]
+    # the footprints are gathered into a stack, reflected at the border like np.pad(data, halfsize, mode="reflect"), and
+    # clipped in batches; the stack and the temporaries of the median, nanstd and the growth take about 8 copies of it
+    footprint_bytes = 8 * (2 * halfsize) ** 2 * max(data.itemsize, 4)
+    step_size = max(1, int(max_footprint_bytes // footprint_bytes))
+
+    for start in range(0, n, step_size):
+        end = min(start + step_size, n)
+        subsample[start:end] = sigma_clipped_median(footprints(data, x_sub[start:end], y_sub[start:end], halfsize))
 
     return subsample
 
 
+def sigma_clipped_median(footprints, sigma=3.0, maxiters=5, grow=4):
+    """
+    Median of each footprint in a stack of shape (n, h, w) after sigma clipping. Gives the same result as
+    sigma_clipped_stats(footprint, cenfunc="median", stdfunc="std", grow=grow)[1] for every footprint: values farther
+    than sigma standard deviations from the median are rejected together with their neighbors within grow pixels,
+    until no more values are rejected or maxiters is reached.
+    """
+    filtered = footprints.astype(np.promote_types(footprints.dtype, np.float32)).reshape(footprints.shape[0], -1)
+    filtered[~np.isfinite(filtered)] = np.nan
+
+    # offsets within the circular growth kernel
+    r = int(grow)
+    yy, xx = np.mgrid[-r : r + 1, -r : r + 1]
+    in_kernel = yy**2 + xx**2 <= grow**2
+    offsets = list(zip(yy[in_kernel], xx[in_kernel]))
+
+    for _ in range(maxiters):
+        with warnings.catch_warnings():
+            # footprints where all values have been rejected
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            cen = batch_nanmedian(filtered)[:, None]
+            std = np.nanstd(filtered, axis=1, keepdims=True)
+
+        with np.errstate(invalid="ignore"):
+            # comparisons with NaN are False, so only newly rejected values are grown
+            new_mask = (filtered < cen - sigma * std) | (filtered > cen + sigma * std)
+
+        # only footprints with new rejections need to be grown
+        changed = np.flatnonzero(np.any(new_mask, axis=1))
+        if len(changed) == 0:
+            break
+
+        grown = grow_mask(new_mask[changed].reshape((-1,) + footprints.shape[1:]), offsets)
+        filtered[changed] = np.where(grown.reshape(len(changed), -1), np.nan, filtered[changed])
+
+    return batch_nanmedian(filtered)
+
+
+def grow_mask(mask, offsets):
+    # binary dilation of each (h, w) mask in the stack with the kernel given by its offsets, as the union of shifted
+    # copies; for the small kernels used here this is much faster than scipy.ndimage.binary_dilation
+    grown = mask.copy()
+    h, w = mask.shape[1:]
+    for dy, dx in offsets:
+        grown[:, max(dy, 0) : h + min(dy, 0), max(dx, 0) : w + min(dx, 0)] |= mask[:, max(-dy, 0) : h + min(-dy, 0), max(-dx, 0) : w + min(-dx, 0)]
+    return grown
+
+
+def batch_nanmedian(a):
+    # median of each row of a, ignoring NaNs; unlike np.nanmedian along an axis, this does not fall back to a
+    # loop over the rows. NaNs are sorted to the end of each row
+    a = np.sort(a, axis=1)
+    count = np.count_nonzero(~np.isnan(a), axis=1)
+    rows = np.arange(a.shape[0])
+    lower = a[rows, np.maximum(count - 1, 0) // 2]
+    upper = a[rows, count // 2]
+    return np.where(count > 0, (lower + upper) / 2, np.nan)
+
+
+def auto_downscale_factor(shape, x_sub, y_sub):
+    if len(x_sub) > 1:
+        points = np.stack([x_sub, y_sub], -1)
+        dist, _ = spatial.cKDTree(points).query(points, k=2)
+        spacing = np.median(dist[:, 1])
+    else:
+        spacing = max(shape)
+
+    downscale_factor = min(int(spacing / samples_per_spacing), max_downscale_factor, min(shape) // min_downscaled_size)
+
+    return max(1, downscale_factor)
+
+
+def reduced_downscale_factor(downscale_factor, error):
+    # the upsampling error grows about quadratically with the downscale factor; the factor is lowered by at least one
+    return max(1, min(downscale_factor - 1, int(downscale_factor * np.sqrt(max_upsampling_error / error))))
+
+
+def upsampling_error(background, x_sub, y_sub, model_at_samples):
+    # deviation of the upsampled background from the model evaluated at the sample points, relative to the model's range
+    model_at_samples = model_at_samples.reshape(len(x_sub), -1)
+    error = np.max(np.abs(background[y_sub, x_sub].reshape(model_at_samples.shape) - model_at_samples), axis=0)
+    return np.max(error / (np.ptp(model_at_samples, axis=0) + np.finfo(np.float32).eps))
+
+
+def scale_points(x_sub, y_sub, shape, downscale_factor):
+    if downscale_factor != 1:
+        shape_scaled = (shape[0] // downscale_factor, shape[1] // downscale_factor)
+
+        # map pixel centers the same way as cv2.resize does when the result is upsampled again
+        x_sub = (x_sub + 0.5) * shape_scaled[1] / shape[1] - 0.5
+        y_sub = (y_sub + 0.5) * shape_scaled[0] / shape[0] - 0.5
+
+    else:
+        shape_scaled = shape
+
+    return x_sub, y_sub, shape_scaled
+
+
+def interpol_global(imarray, background, x_sub, y_sub, kind, smoothing, downscale_factor, sample_size, RBF_kernel, RBF_tolerance=0.0, block_size=None, num_workers=None, kriging_neighbors=None):
+    # RBF and Kriging models are set up once for all channels in the calling process. For RBF, this allows later
+    # calculations with the same points (e.g. another correction type or the next image of a sequence) to reuse the
+    # cached factorization. Only the evaluation, which dominates the runtime, is distributed over the process pool in
+    # blocks of 'block_size' rows, with at most 'num_workers' blocks processed at the same time. If 'kriging_neighbors'
+    # is given, Kriging solves local systems with that many samples instead of a global system.
+    shape = imarray.shape[:2]
+    num_colors = imarray.shape[-1]
+
+    subsample = np.stack([calc_mode_dataset(imarray[:, :, c], x_sub, y_sub, sample_size) for c in range(num_colors)], -1)
+
+    x_sub, y_sub, shape_scaled = scale_points(x_sub, y_sub, shape, downscale_factor)
+
+    points_stacked = np.stack([x_sub, y_sub], -1)
+    if kind == "RBF":
+        interp = RadialBasisInterpolation(points_stacked, subsample, kernel=RBF_kernel, smooth=smoothing * linalg.norm(subsample, axis=0) / np.sqrt(len(subsample)), tol=RBF_tolerance)
+    else:
+        interp = OrdinaryKrigingInterpolation(points_stacked, subsample, neighbors=kriging_neighbors)
+
+    shm_result = shared_memory.SharedMemory(create=True, size=int(np.prod(shape_scaled)) * num_colors * np.dtype(np.float32).itemsize)
+    result = np.ndarray(shape_scaled + (num_colors,), dtype=np.float32, buffer=shm_result.buf)
+
+    if num_workers is None or num_workers < 1:
+        num_workers = max_workers
+    if block_size is None or block_size < 1:
+        block_size = -(-shape_scaled[0] // min(num_workers, max_workers))
+
+    futures = set()
+    logging_queue = get_logging_queue()
+    for row_start in range(0, shape_scaled[0], block_size):
+        if len(futures) >= num_workers:
+            _, futures = wait(futures, return_when=FIRST_COMPLETED)
+        row_end = min(row_start + block_size, shape_scaled[0])
+        futures.add(executor.submit(interpol_rows, shm_result.name, result.shape, result.dtype, interp, row_start, row_end, logging_queue, worker_configurer))
+    wait(futures)
+
+    if downscale_factor != 1:
+        background[:] = cv2.resize(src=result, dsize=(shape[1], shape[0]), interpolation=cv2.INTER_LINEAR).reshape(background.shape)
+    else:
+        background[:] = result
+
+    shm_result.close()
+    shm_result.unlink()
+
+    return interp(points_stacked)
+
+
+def interpol_lsq_spline(imarray, background, x_sub, y_sub, smoothing, downscale_factor, sample_size, spline_order, spline_knots):
+    # Least-squares spline on a fixed lattice of 'spline_knots' interior knots per axis, fitted for all channels at
+    # once. Its separable evaluation on the (downscaled) grid is cheap enough for the calling process.
+    shape = imarray.shape[:2]
+    num_colors = imarray.shape[-1]
+
+    subsample = np.stack([calc_mode_dataset(imarray[:, :, c], x_sub, y_sub, sample_size) for c in range(num_colors)], -1)
+
+    x_sub, y_sub, shape_scaled = scale_points(x_sub, y_sub, shape, downscale_factor)
+
+    domain = ((min(np.min(x_sub), 0), max(np.max(x_sub), shape_scaled[1] - 1)), (min(np.min(y_sub), 0), max(np.max(y_sub), shape_scaled[0] - 1)))
+    interp = TensorProductSpline(x_sub, y_sub, subsample, domain, knots=spline_knots, order=spline_order, smoothing=smoothing)
+
+    result = interp.grid(np.arange(0, shape_scaled[1], 1), np.arange(0, shape_scaled[0], 1)).astype(np.float32)
+
+    if downscale_factor != 1:
+        background[:] = cv2.resize(src=result, dsize=(shape[1], shape[0]), interpolation=cv2.INTER_LINEAR).reshape(background.shape)
+    else:
+        background[:] = result
+
+    return interp(x_sub, y_sub)
+
+
+def interpol_rows(shm_result_name, shape, dtype, interp, row_start, row_end, logging_queue, logging_configurer):
+
+    logging_configurer(logging_queue)
+    logging.info("background_extraction.interpol_rows started")
+
+    try:
+        existing_shm_result = shared_memory.SharedMemory(name=shm_result_name)
+        result = np.ndarray(shape, dtype, buffer=existing_shm_result.buf)
+
+        # Create background from interpolation, in blocks of rows sized by the memory budget of the interpolation and
+        # written directly into the shared result. The interpolation evaluates in float64 whatever the dtype of the
+        # result, so the blocks are sized for float64
+        x_new = np.arange(0, shape[1], 1)
+        block_rows = max(1, interp.block_size(np.float64) // shape[1])
+
+        for block_start in range(row_start, row_end, block_rows):
+            block_end = min(block_start + block_rows, row_end)
+            y_new = np.arange(block_start, block_end, 1)
+
+            xx, yy = np.meshgrid(x_new, y_new)
+            points_new_stacked = np.stack([xx.ravel(), yy.ravel()], -1)
+
+            interp(points_new_stacked, out=result[block_start:block_end].reshape(len(points_new_stacked), -1))
+    except Exception as e:
+        logging.exception("Error occured during background_extraction.interpol_rows")
+
+    existing_shm_result.close()
+
+    logging.info("background_extraction.interpol_rows finished")
+
+
 def interpol(shm_imarray_name, shm_background_name, c, x_sub, y_sub, shape, kind, smoothing, downscale_factor, sample_size, RBF_kernel, spline_order, dtype, logging_queue, logging_configurer):
 
     logging_configurer(logging_queue)
     logging.info("background_extraction.interpol started")
 
+    model_at_samples = None
+
     try:
         existing_shm_imarray = shared_memory.SharedMemory(name=shm_imarray_name)
         existing_shm_background = shared_memory.SharedMemory(name=shm_background_name)
@@ -216,32 +513,9 @@ def interpol(shm_imarray_name, shm_background_name, c, x_sub, y_sub, shape, kind
 
         subsample = calc_mode_dataset(imarray, x_sub, y_sub, sample_size)
 
-        if downscale_factor != 1:
-            x_sub = x_sub / shape[1]
-            y_sub = y_sub / shape[0]
-
-            shape_scaled = (shape[0] // downscale_factor, shape[1] // downscale_factor)
-
-            x_sub = x_sub * shape_scaled[1]
-            y_sub = y_sub * shape_scaled[0]
-
-        else:
-            shape_scaled = shape
-
-        if kind == "RBF":
-            points_stacked = np.stack([x_sub, y_sub], -1)
-            interp = RadialBasisInterpolation(points_stacked, subsample, kernel=RBF_kernel, smooth=smoothing * linalg.norm(subsample) / np.sqrt(len(subsample)))
-
-            # Create background from interpolation
-            x_new = np.arange(0, shape_scaled[1], 1)
-            y_new = np.arange(0, shape_scaled[0], 1)
-
-            xx, yy = np.meshgrid(x_new, y_new)
-            points_new_stacked = np.stack([xx.ravel(), yy.ravel()], -1)
-
-            result = interp(points_new_stacked).reshape(shape_scaled)
+        x_sub, y_sub, shape_scaled = scale_points(x_sub, y_sub, shape, downscale_factor)
 
-        elif kind == "Splines":
+        if kind == "Splines":
             interp = interpolate.bisplrep(y_sub, x_sub, subsample, w=np.ones(len(x_sub)) / np.std(subsample), s=smoothing * len(x_sub), kx=spline_order, ky=spline_order)
 
             # Create background from interpolation
@@ -249,30 +523,7 @@ def interpol(shm_imarray_name, shm_background_name, c, x_sub, y_sub, shape, kind
             y_new = np.arange(0, shape_scaled[0], 1)
             result = interpolate.bisplev(y_new, x_new, interp)
 
-        elif kind == "Kriging":
-            OK = OrdinaryKriging(
-                x=x_sub,
-                y=y_sub,
-                z=subsample,
-                variogram_model="spherical",
-                verbose=False,
-                enable_plotting=False,
-            )
-
-            # Create background from interpolation
-            x_new = np.arange(0, shape_scaled[1], 1).astype("float64")
-            y_new = np.arange(0, shape_scaled[0], 1).astype("float64")
-
-            result = np.zeros(shape_scaled, dtype=np.float32)
-
-            num_it = shape_scaled[0] // 50
-
-            for i in range(num_it):
-                result_i, var = OK.execute("grid", xpoints=x_new, ypoints=y_new[i * 50 : (i + 1) * 50], backend="vectorized")
-                result[i * 50 : (i + 1) * 50, :] = result_i
-
-            result_i, var = OK.execute("grid", xpoints=x_new, ypoints=y_new[num_it * 50 :], backend="vectorized")
-            result[num_it * 50 :, :] = result_i
+            model_at_samples = np.array([interpolate.bisplev(y, x, interp) for x, y in zip(x_sub, y_sub)])
 
         else:
             logging.warning("Interpolation method not recognized")
@@ -289,3 +540,5 @@ def interpol(shm_imarray_name, shm_background_name, c, x_sub, y_sub, shape, kind
     existing_shm_background.close()
 
     logging.info("background_extraction.interpol finished")
+
+    return model_at_samples
@@ -1,60 +1,71 @@
 import logging
-from concurrent.futures.process import _ResultItem
 
 import numpy as np
-from scipy.spatial import KDTree
 from skimage.color import rgb2gray
 
 from graxpert.astroimage import AstroImage
-from graxpert.grid_utils import find_darkest_quadrant
+from graxpert.grid_utils import find_darkest_quadrant, find_darkest_quadrants
+from graxpert.point_index import PointIndex
 
 
 def idx_to_coords(idx, dist):
     return int(idx[0] * dist + dist / 2), int(idx[1] * dist + dist / 2)
 
 
-def candidate_visited(candidate_idx, found_row_segments):
+class GridMedians:
+    """
+    Darkest quadrant and its median for every point of the flood selection grid of an image, computed once per
+    (bg_pts, sample_size) and kept in the image until it is loaded, cropped or its display changes
+    """
 
-    for segment in found_row_segments:
-        if (
-            candidate_idx[1] == segment["y"]
-            and segment["xl"] <= candidate_idx[0]
-            and candidate_idx[0] <= segment["xr"]
-        ):
-            return True
-
-    return False
-
-
-def candidate_valid(
-    candidate_idx,
-    width,
-    height,
-    dist,
-    selected_median,
-    tol,
-    mad,
-    data_mono_padded,
-    halfsize,
-):
-    x_pt, y_pt = idx_to_coords(candidate_idx, dist)
+    def __init__(self, image: AstroImage, bg_pts, sample_size):
+        # Convert to mono
+        data_mono = np.asarray(image.img_display)
+        if data_mono.ndim == 3 and data_mono.shape[-1] == 3:
+            data_mono = rgb2gray(data_mono).astype(np.float32)
+        self.data_mono = data_mono
+        self.global_median = np.median(data_mono)
+
+        width = image.width
+        height = image.height
+        self.dist = width / bg_pts
+
+        # number of grid indices with coordinates inside the image
+        nx = 0
+        while idx_to_coords([nx, 0], self.dist)[0] < width:
+            nx += 1
+        ny = 0
+        while idx_to_coords([0, ny], self.dist)[1] < height:
+            ny += 1
+
+        x_idx, y_idx = np.meshgrid(np.arange(nx), np.arange(ny))
+        x = (x_idx * self.dist + self.dist / 2).astype(int)
+        y = (y_idx * self.dist + self.dist / 2).astype(int)
+        pts, medians = find_darkest_quadrants(x.ravel(), y.ravel(), data_mono, sample_size)
+        self.points = pts.reshape(ny, nx, 2)
+        self.medians = medians.reshape(ny, nx)
 
-    if x_pt < 0 or x_pt >= width or y_pt < 0 or y_pt >= height:
-        return False
+        # Calculate median average deviation
+        self.mad = np.median(np.abs(self.medians - self.global_median))
 
-    pt, local_median = find_darkest_quadrant(x_pt, y_pt, data_mono_padded, halfsize)
+    @staticmethod
+    def get(image: AstroImage, bg_pts, sample_size):
+        key = (bg_pts, sample_size)
+        if key not in image.grid_medians:
+            image.grid_medians[key] = GridMedians(image, bg_pts, sample_size)
+        return image.grid_medians[key]
 
-    if (selected_median - tol * mad / 10) <= local_median and local_median <= (selected_median + tol * mad / 10):
-        return True
 
-    return False
+def in_grid(candidate_idx, table):
+    return 0 <= candidate_idx[0] < table.shape[1] and 0 <= candidate_idx[1] < table.shape[0]
 
 
-def overlap(p1, p2, sample_size):
+def candidate_visited(candidate_idx, visited):
+    return in_grid(candidate_idx, visited) and visited[candidate_idx[1], candidate_idx[0]]
 
-    if abs(p1[0] - p2[0]) <= sample_size * 2 and abs(p1[1] - p2[1]) <= sample_size * 2:
-        return True
-    return False
+
+def candidate_valid(candidate_idx, valid):
+    return in_grid(candidate_idx, valid) and valid[candidate_idx[1], candidate_idx[0]]
 
 
 def background_flood_selection(
@@ -64,58 +75,21 @@ def background_flood_selection(
     bg_pts,
     sample_size,
     image: AstroImage,
+    point_index: PointIndex = None,
 ):
-    # Convert to mono
-    data_mono = np.copy(image.img_display)
-    if data_mono.shape[-1] == 3:
-        data_mono = rgb2gray(data_mono)
-
-    global_median = np.median(data_mono)
-
-    grid_pts = []
-    dist = data_mono.shape[1] / bg_pts
-
-    # Create grid
-    x_start = int(0.5 * dist)
-    y_start = int(0.5 * (data_mono.shape[0] % dist))
-    x = x_start
-    y = y_start
-
-    while y < data_mono.shape[0]:
-        x = x_start
-        while x < data_mono.shape[1]:
-            grid_pts.append([y, x])
-            x = int(x + dist)
-        y = int(y + dist)
-
-    # Calculate median around each grid point
-    local_median = np.zeros(len(grid_pts))
-    halfsize = sample_size
-    data_mono_padded = np.pad(array=data_mono, pad_width=(halfsize,), mode="reflect")
-
-    r = range(len(grid_pts))
-    for i in r:
-        x_pt = grid_pts[i][0]
-        y_pt = grid_pts[i][1]
-
-        pt, median = find_darkest_quadrant(x_pt, y_pt, data_mono_padded, halfsize)
-
-        grid_pts[i][0] = pt[0]
-        grid_pts[i][1] = pt[1]
-        local_median[i] = median
-
-    # Calculate median average deviation
-    mad = np.median(np.abs(local_median - global_median))
+    grid = GridMedians.get(image, bg_pts, sample_size)
+    dist = grid.dist
 
     pt, candidate_median = find_darkest_quadrant(
-        int(selected_point[0]), int(selected_point[1]), data_mono_padded, sample_size
+        int(selected_point[0]), int(selected_point[1]), grid.data_mono, sample_size
     )
 
-    width = image.width
-    height = image.height
+    # grid points within tolerance of the selected point
+    valid = (candidate_median - tol * grid.mad / 10 <= grid.medians) & (grid.medians <= candidate_median + tol * grid.mad / 10)
+    visited = np.zeros(valid.shape, dtype=bool)
 
-    # distance between grid points
-    dist = width / bg_pts
+    x_start = int(0.5 * dist)
+    y_start = int(0.5 * (image.height % dist))
 
     # first candidate row index
     x_candidate_idx = int(((selected_point[0] - x_start) / dist))
@@ -141,21 +115,11 @@ def background_flood_selection(
 
         candidate_idx = candidate_idxs.pop()
 
-        if candidate_visited(candidate_idx, found_row_segments):
-            logging.debug("candidate_valid")
+        if candidate_visited(candidate_idx, visited):
+            logging.debug("candidate_visited")
             continue
 
-        if not candidate_valid(
-            candidate_idx,
-            width,
-            height,
-            dist,
-            candidate_median,
-            tol,
-            mad,
-            data_mono_padded,
-            halfsize,
-        ):
+        if not candidate_valid(candidate_idx, valid):
             logging.debug("candidate_valid")
             continue
 
@@ -166,50 +130,28 @@ def background_flood_selection(
         }
 
         next_candidate_idx = [candidate_idx[0] - 1, candidate_idx[1]]
-        while candidate_valid(
-            next_candidate_idx,
-            width,
-            height,
-            dist,
-            candidate_median,
-            tol,
-            mad,
-            data_mono_padded,
-            halfsize,
-        ):
+        while candidate_valid(next_candidate_idx, valid):
             row_segment["xl"] = next_candidate_idx[0]
             candidate_idxs.append([next_candidate_idx[0], next_candidate_idx[1] - 1])
             candidate_idxs.append([next_candidate_idx[0], next_candidate_idx[1] + 1])
             next_candidate_idx = [next_candidate_idx[0] - 1, next_candidate_idx[1]]
 
         next_candidate_idx = [candidate_idx[0] + 1, candidate_idx[1]]
-        while candidate_valid(
-            next_candidate_idx,
-            width,
-            height,
-            dist,
-            candidate_median,
-            tol,
-            mad,
-            data_mono_padded,
-            halfsize,
-        ):
+        while candidate_valid(next_candidate_idx, valid):
             row_segment["xr"] = next_candidate_idx[0]
             candidate_idxs.append([next_candidate_idx[0], next_candidate_idx[1] - 1])
             candidate_idxs.append([next_candidate_idx[0], next_candidate_idx[1] + 1])
             next_candidate_idx = [next_candidate_idx[0] + 1, next_candidate_idx[1]]
 
         found_row_segments.append(row_segment)
+        visited[row_segment["y"], row_segment["xl"] : row_segment["xr"] + 1] = True
 
     # step 2: compute actual points from found row segments
 
     found_points = [selected_point]
 
     for segment in found_row_segments:
-        y_idx = segment["y"]
-        for x_idx in range(segment["xl"], segment["xr"] + 1):
-            x, y = idx_to_coords([x_idx, y_idx], dist)
-            pt, median = find_darkest_quadrant(x, y, data_mono_padded, sample_size)
+        for pt in grid.points[segment["y"], segment["xl"] : segment["xr"] + 1]:
             found_points.append([pt[0], pt[1], 1])
 
     # step 3: check for and eliminate duplicates
@@ -220,21 +162,13 @@ def background_flood_selection(
             result.append(np.array(p, dtype=int))
         return result
 
-    confirmed_points = []
-
-    background_tree = KDTree(current_background_points)
+    if point_index is None:
+        point_index = PointIndex(current_background_points)
 
-    for f in found_points:
-        f_neighbors = background_tree.query_ball_point(f, dist * 2)
-        overlaps = False
-        for n_idx in f_neighbors:
-            if overlap(current_background_points[n_idx], f, sample_size):
-                overlaps = True
-        if not overlaps:
-            confirmed_points.append(f)
-    
     result = []
-    for p in confirmed_points:
-        result.append(np.array(p, dtype=int))
-    
+    for f in found_points:
+        # samples overlap if they are closer than twice the sample size in both directions
+        if not point_index.query_box(f[0], f[1], sample_size * 2):
+            result.append(np.array(f, dtype=int))
+
     return result
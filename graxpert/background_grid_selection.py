@@ -1,64 +1,45 @@
 import numpy as np
-from skimage import color
 
-import graxpert.skyall
-import graxpert.stretch
-from graxpert.grid_utils import find_darkest_quadrant
+from graxpert.grid_utils import find_darkest_quadrants, luminance_weights
+
+
+# The global median is computed on a regular subsample of at most this many pixels
+max_median_pixels = 4 * 10**6
+
+
+def grid_coordinates(start, dist, end):
+    coordinates = []
+    c = start
+    while c < end:
+        coordinates.append(c)
+        c = int(c + dist)
+    return np.array(coordinates, dtype=int)
 
 
 def background_grid_selection(data, num_pts_per_row, tol, sample_size):
 
-    # Convert to mono
-    data_mono = np.copy(data)
-    if(data_mono.shape[-1] == 3):
-        data_mono = color.rgb2gray(data_mono)
+    height, width = data.shape[:2]
+
+    # Global median of the luminance
+    step = max(1, int(np.ceil(np.sqrt(height * width / max_median_pixels))))
+    data_subsample = data[::step, ::step]
+    if data_subsample.shape[-1] == 3:
+        data_subsample = data_subsample @ np.array(luminance_weights, dtype=data.dtype)
     else:
-        data_mono = data_mono[:,:,0]
-        
-    global_median = np.median(data_mono)
-    
-    background_pts = []
-    dist = data_mono.shape[1] / num_pts_per_row
-    
-    # Create grid
-    x_start = int(0.5 * dist)
-    y_start = int(0.5 * (data_mono.shape[0] % dist))
-    x = x_start
-    y = y_start
-    
-    while(y < data_mono.shape[0]):
-        x = x_start
-        while(x < data_mono.shape[1]):
-            background_pts.append([x,y,1])
-            x = int(x + dist)           
-        y = int(y+dist)
-    
-    # Calculate median around each grid point
-    local_median = np.zeros(len(background_pts))
-    halfsize = sample_size
-    data_mono_padded = np.pad(array=data_mono, pad_width=(halfsize,), mode="reflect")
+        data_subsample = data_subsample[:, :, 0]
+    global_median = np.median(data_subsample)
 
-    
-    for i in range(len(background_pts)):
-        x_pt = background_pts[i][0]
-        y_pt = background_pts[i][1]
-        
-        pt, median = find_darkest_quadrant(x_pt, y_pt, data_mono_padded, halfsize)
+    # Create grid
+    dist = width / num_pts_per_row
+    x_grid = grid_coordinates(int(0.5 * dist), dist, width)
+    y_grid = grid_coordinates(int(0.5 * (height % dist)), dist, height)
+    y, x = np.meshgrid(y_grid, x_grid, indexing="ij")
 
-        background_pts[i][0] = pt[0]
-        background_pts[i][1] = pt[1]
-        local_median[i] = median
+    # Calculate median around each grid point
+    pts, local_median = find_darkest_quadrants(x.ravel(), y.ravel(), data, sample_size)
 
-    # Calculate median average deviation and remove points not within tolerance 
+    # Calculate median average deviation and remove points not within tolerance
     mad = np.median(np.abs(local_median - global_median))
-    
-    background_pts_sliced = []
-    for i in range(len(background_pts)):
-        if(local_median[i] < global_median + tol*mad):
-            background_pts_sliced.append(background_pts[i])
+    pts = pts[local_median < global_median + tol * mad]
 
-    result = []
-    for p in background_pts_sliced:
-        result.append(np.array(p, dtype=int))
-    
-    return result
+    return np.concatenate([pts, np.ones((len(pts), 1), dtype=int)], axis=1)
@@ -18,7 +18,7 @@ from graxpert.ai_model_handling import (
     list_local_versions,
 )
 from graxpert.astroimage import AstroImage
-from graxpert.background_extraction import extract_background
+from graxpert.background_extraction import extract_background, extract_background_ai_batch
 from graxpert.denoising import denoise
 from graxpert.deconvolution import deconvolve
 from graxpert.preferences import Prefs, load_preferences, save_preferences
@@ -46,13 +46,16 @@ class CmdlineToolBase:
         else:
             return "32 bit Fits"
 
-    def get_save_path(self):
+    def get_save_path(self, filename=None):
+        if filename is None:
+            filename = self.args.filename
+
         if self.args.output is not None:
-            base_path = os.path.dirname(self.args.filename)
+            base_path = os.path.dirname(filename)
             output_file_name = self.args.output + self.get_output_file_ending()
             return os.path.join(base_path, output_file_name)
         else:
-            return os.path.splitext(self.args.filename)[0] + "_GraXpert" + self.get_output_file_ending()
+            return os.path.splitext(filename)[0] + "_GraXpert" + self.get_output_file_ending()
 
 
 class BGECmdlineTool(CmdlineToolBase):
@@ -60,17 +63,6 @@ class BGECmdlineTool(CmdlineToolBase):
         super().__init__(args)
 
     def execute(self):
-        astro_Image = AstroImage(do_update_display=False)
-        astro_Image.set_from_file(self.args.filename, None, None)
-
-        processed_Astro_Image = AstroImage(do_update_display=False)
-        background_Astro_Image = AstroImage(do_update_display=False)
-
-        processed_Astro_Image.fits_header = astro_Image.fits_header
-        background_Astro_Image.fits_header = astro_Image.fits_header
-
-        downscale_factor = 1
-
         if self.args.preferences_file is not None:
             preferences = Prefs()
             preferences.interpol_type_option = "AI"
@@ -83,6 +75,14 @@ class BGECmdlineTool(CmdlineToolBase):
                             preferences.background_points = json_prefs["background_points"]
                         if "RBF_kernel" in json_prefs:
                             preferences.RBF_kernel = json_prefs["RBF_kernel"]
+                        if "RBF_tolerance" in json_prefs:
+                            preferences.RBF_tolerance = json_prefs["RBF_tolerance"]
+                        if "interpol_block_size" in json_prefs:
+                            preferences.interpol_block_size = json_prefs["interpol_block_size"]
+                        if "interpol_workers" in json_prefs:
+                            preferences.interpol_workers = json_prefs["interpol_workers"]
+                        if "kriging_neighbors" in json_prefs:
+                            preferences.kriging_neighbors = json_prefs["kriging_neighbors"]
                         if "interpol_type_option" in json_prefs:
                             preferences.interpol_type_option = json_prefs["interpol_type_option"]
                         if "smoothing_option" in json_prefs:
@@ -91,15 +91,18 @@ class BGECmdlineTool(CmdlineToolBase):
                             preferences.sample_size = json_prefs["sample_size"]
                         if "spline_order" in json_prefs:
                             preferences.spline_order = json_prefs["spline_order"]
+                        if "spline_knots" in json_prefs:
+                            preferences.spline_knots = json_prefs["spline_knots"]
+                        if "downscale_factor" in json_prefs:
+                            preferences.downscale_factor = json_prefs["downscale_factor"]
                         if "corr_type" in json_prefs:
                             preferences.corr_type = json_prefs["corr_type"]
                         if "ai_version" in json_prefs:
                             preferences.ai_version = json_prefs["ai_version"]
                         if "ai_gpu_acceleration" in json_prefs:
                             preferences.ai_gpu_acceleration = json_prefs["ai_gpu_acceleration"]
-
-                        if preferences.interpol_type_option == "Kriging" or preferences.interpol_type_option == "RBF":
-                            downscale_factor = 4
+                        if "ai_batch_size" in json_prefs:
+                            preferences.ai_batch_size = json_prefs["ai_batch_size"]
 
             except Exception as e:
                 logging.exception(e)
@@ -127,6 +130,19 @@ class BGECmdlineTool(CmdlineToolBase):
         else:
             logging.info(f"Using stored gpu acceleration setting {preferences.ai_gpu_acceleration}.")
 
+        if self.args.ai_batch_size is not None:
+            preferences.ai_batch_size = self.args.ai_batch_size
+            logging.info(f"Using user-supplied batch size value {preferences.ai_batch_size}.")
+        else:
+            logging.info(f"Using stored batch size value {preferences.ai_batch_size}.")
+
+        # without a fixed factor, the resolution at which the background model is evaluated is chosen from the image size
+        # and sample spacing
+        if self.args.downscale_factor is not None:
+            preferences.downscale_factor = self.args.downscale_factor
+            logging.info(f"Using user-supplied downscale factor {preferences.downscale_factor}.")
+        downscale_factor = preferences.downscale_factor
+
         if preferences.interpol_type_option == "AI":
             ai_model_path = ai_model_path_from_version(bge_ai_models_dir, self.get_ai_version(preferences))
         else:
@@ -155,10 +171,37 @@ class BGECmdlineTool(CmdlineToolBase):
                               spline order - {preferences.spline_order}
                                  smoothing - {preferences.smoothing_option}
                             orrection type - {preferences.corr_type}
-                         downscale_factor  - {downscale_factor}"""
+                         downscale_factor  - {downscale_factor or "auto"}"""
                 )
             )
 
+        filenames = [self.args.filename]
+        if self.args.additional_filenames:
+            filenames.extend(self.args.additional_filenames)
+
+        if len(filenames) > 1 and self.args.output is not None:
+            logging.warning(f"Ignoring user-supplied output filename {self.args.output} because {len(filenames)} images are processed.")
+            self.args.output = None
+
+        if preferences.interpol_type_option == "AI" and len(filenames) > 1:
+            # load and process the images chunk-wise to bound memory consumption for long sequences
+            batch_size = max(1, preferences.ai_batch_size)
+            for b in range(0, len(filenames), batch_size):
+                self.execute_ai_batch(filenames[b : b + batch_size], preferences, ai_model_path)
+        else:
+            for filename in filenames:
+                self.execute_single(filename, preferences, downscale_factor, ai_model_path)
+
+    def execute_single(self, filename, preferences, downscale_factor, ai_model_path):
+        astro_Image = AstroImage(do_update_display=False)
+        astro_Image.set_from_file(filename, None, None)
+
+        processed_Astro_Image = AstroImage(do_update_display=False)
+        background_Astro_Image = AstroImage(do_update_display=False)
+
+        processed_Astro_Image.fits_header = astro_Image.fits_header
+        background_Astro_Image.fits_header = astro_Image.fits_header
+
         background_Astro_Image.set_from_array(
             extract_background(
                 astro_Image.img_array,
@@ -172,14 +215,49 @@ class BGECmdlineTool(CmdlineToolBase):
                 preferences.corr_type,
                 ai_model_path,
                 ai_gpu_acceleration=preferences.ai_gpu_acceleration,
+                RBF_tolerance=preferences.RBF_tolerance,
+                block_size=preferences.interpol_block_size,
+                num_workers=preferences.interpol_workers,
+                kriging_neighbors=preferences.kriging_neighbors,
+                spline_knots=preferences.spline_knots,
             )
         )
 
         processed_Astro_Image.set_from_array(astro_Image.img_array)
 
-        processed_Astro_Image.save(self.get_save_path(), self.get_output_file_format())
+        processed_Astro_Image.save(self.get_save_path(filename), self.get_output_file_format())
         if self.args.bg:
-            background_Astro_Image.save(self.get_background_save_path(), self.get_output_file_format())
+            background_Astro_Image.save(self.get_background_save_path(filename), self.get_output_file_format())
+
+    def execute_ai_batch(self, filenames, preferences, ai_model_path):
+        logging.info(f"Excecuting batched background extraction on {len(filenames)} images")
+
+        astro_Images = []
+        for filename in filenames:
+            astro_Image = AstroImage(do_update_display=False)
+            astro_Image.set_from_file(filename, None, None)
+            astro_Images.append(astro_Image)
+
+        backgrounds = extract_background_ai_batch(
+            [a.img_array for a in astro_Images],
+            preferences.smoothing_option,
+            preferences.corr_type,
+            ai_model_path,
+            batch_size=preferences.ai_batch_size,
+            ai_gpu_acceleration=preferences.ai_gpu_acceleration,
+        )
+
+        for filename, astro_Image, background in zip(filenames, astro_Images, backgrounds):
+            processed_Astro_Image = AstroImage(do_update_display=False)
+            processed_Astro_Image.fits_header = astro_Image.fits_header
+            processed_Astro_Image.set_from_array(astro_Image.img_array)
+            processed_Astro_Image.save(self.get_save_path(filename), self.get_output_file_format())
+
+            if self.args.bg:
+                background_Astro_Image = AstroImage(do_update_display=False)
+                background_Astro_Image.fits_header = astro_Image.fits_header
+                background_Astro_Image.set_from_array(background)
+                background_Astro_Image.save(self.get_background_save_path(filename), self.get_output_file_format())
 
     def get_ai_version(self, prefs):
         user_preferences = load_preferences(user_preferences_filename)
@@ -210,8 +288,8 @@ class BGECmdlineTool(CmdlineToolBase):
 
         return ai_version
 
-    def get_background_save_path(self):
-        save_path = self.get_save_path()
+    def get_background_save_path(self, filename=None):
+        save_path = self.get_save_path(filename)
         return os.path.splitext(save_path)[0] + "_background" + self.get_output_file_ending()
 
 
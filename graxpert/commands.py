@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from copy import deepcopy
 from typing import Dict
 
 import numpy as np
@@ -67,128 +66,140 @@ class Command:
     def redo(self) -> Command:
         assert self.next is not None
         next_state = self.next.app_state
-        self.next.app_state = self.handler.redo(self.app_state, next_state, self.cmd_args)
+        # the change to repeat is the one of the next command
+        self.next.app_state = self.next.handler.redo(self.app_state, next_state, self.next.cmd_args)
         return self.next
 
 
 class InitHandler(ICommandHandler):
 
     def execute(self, app_state: AppState, cmd_args: Dict) -> AppState:
-        state = INITIAL_STATE
-        state.background_points = cmd_args["background_points"]
-        return state
+        return AppState(cmd_args["background_points"])
 
     def undo(
         self, cur_state: AppState, prev_state: AppState, cmd_args: Dict
     ) -> AppState:
-        state = INITIAL_STATE
-        state.background_points = cmd_args["background_points"]
-        return state
+        return AppState(cmd_args["background_points"])
 
     def redo(
         self, cur_state: AppState, next_state: AppState, cmd_args: Dict
     ) -> AppState:
-        return deepcopy(next_state)
+        return next_state
 
     def progress(self) -> float:
         return 1.0
 
 class PointHandler(ICommandHandler):
-    def undo(
-        self, cur_state: AppState, prev_state: AppState, cmd_args: Dict
-    ) -> AppState:
-        app_state_copy = deepcopy(cur_state)
-        prev_background_points = deepcopy(prev_state.background_points)
-        app_state_copy.background_points = prev_background_points
-        return app_state_copy
+    # Point handlers change the app state in place and keep what they changed in cmd_args, so that undo and redo
+    # only need to revert or repeat that change instead of copying all points
 
-    def redo(
-        self, cur_state: AppState, next_state: AppState, cmd_args: Dict
-    ) -> AppState:
-        app_state_copy = deepcopy(cur_state)
-        next_background_points = deepcopy(next_state.background_points)
-        app_state_copy.background_points = next_background_points
-        return app_state_copy
+    def progress(self) -> float:
+        return 1.0
 
 
 class AddPointHandler(PointHandler):
     def execute(self, app_state: AppState, cmd_args: Dict) -> AppState:
-        app_state_copy = deepcopy(app_state)
         point = cmd_args["point"]
-        app_state_copy.background_points.append(point)
-        return app_state_copy
+        app_state.add_points([point[0], point[1], 1])
+        return app_state
 
-    def progress(self) -> float:
-        return 1.0
+    def undo(self, cur_state: AppState, prev_state: AppState, cmd_args: Dict) -> AppState:
+        cur_state.remove_last_points(1)
+        return cur_state
+
+    def redo(self, cur_state: AppState, next_state: AppState, cmd_args: Dict) -> AppState:
+        return self.execute(cur_state, cmd_args)
 
 
 class AddPointsHandler(PointHandler):
     def execute(self, app_state: AppState, cmd_args: Dict) -> AppState:
-        app_state_copy = deepcopy(app_state)
         point = cmd_args["point"]
-        background_points = app_state_copy.background_points
         tol = cmd_args["tol"]
         bg_pts = cmd_args["bg_pts"]
         sample_size = cmd_args["sample_size"]
         image = cmd_args["image"]
-        new_points = background_flood_selection(point, background_points, tol, bg_pts, sample_size, image)
-        app_state_copy.background_points.extend(new_points)
-        return app_state_copy
+        new_points = background_flood_selection(point, app_state.background_points, tol, bg_pts, sample_size, image, app_state.point_index)
+        cmd_args["new_points"] = new_points
+        app_state.add_points(new_points)
+        return app_state
 
-    def progress(self) -> float:
-        return 1.0
+    def undo(self, cur_state: AppState, prev_state: AppState, cmd_args: Dict) -> AppState:
+        cur_state.remove_last_points(len(cmd_args["new_points"]))
+        return cur_state
+
+    def redo(self, cur_state: AppState, next_state: AppState, cmd_args: Dict) -> AppState:
+        cur_state.add_points(cmd_args["new_points"])
+        return cur_state
 
 
 class RemovePointHandler(PointHandler):
     def execute(self, app_state: AppState, cmd_args: Dict) -> AppState:
-        app_state_copy = deepcopy(app_state)
-        idx = cmd_args["idx"]
-        app_state_copy.background_points.pop(idx)
-        return app_state_copy
+        cmd_args["removed_point"] = app_state.remove_point(cmd_args["idx"])
+        return app_state
 
-    def progress(self) -> float:
-        return 1.0
+    def undo(self, cur_state: AppState, prev_state: AppState, cmd_args: Dict) -> AppState:
+        cur_state.restore_point(cmd_args["idx"], cmd_args["removed_point"])
+        return cur_state
+
+    def redo(self, cur_state: AppState, next_state: AppState, cmd_args: Dict) -> AppState:
+        return self.execute(cur_state, cmd_args)
 
 
 class MovePointHandler(PointHandler):
     def execute(self, app_state: AppState, cmd_args: Dict) -> AppState:
-        app_state_copy = deepcopy(app_state)
         idx = cmd_args["idx"]
         new_point = cmd_args["new_point"]
-        
+
         if len(new_point) == 0:
-            app_state_copy.background_points.pop(idx)
+            cmd_args["removed_point"] = app_state.remove_point(idx)
         else:
-            app_state_copy.background_points[idx] = new_point
-        
-        return app_state_copy
-        
-    def progress(self) -> float:
-        return 1.0
-    
-    
+            cmd_args["previous_point"] = app_state.move_point(idx, [new_point[0], new_point[1], 1])
+
+        return app_state
+
+    def undo(self, cur_state: AppState, prev_state: AppState, cmd_args: Dict) -> AppState:
+        if len(cmd_args["new_point"]) == 0:
+            cur_state.restore_point(cmd_args["idx"], cmd_args["removed_point"])
+        else:
+            cur_state.move_point(cmd_args["idx"], cmd_args["previous_point"])
+        return cur_state
+
+    def redo(self, cur_state: AppState, next_state: AppState, cmd_args: Dict) -> AppState:
+        return self.execute(cur_state, cmd_args)
+
+
 class SelectPointsHandler(PointHandler):
     def execute(self, app_state: AppState, cmd_args: Dict) -> AppState:
-        app_state_copy = deepcopy(app_state)
         data = cmd_args["data"]
         num_pts = cmd_args["num_pts"]
         tol = cmd_args["tol"]
         sample_size = cmd_args["sample_size"]
-        automatic_points = background_grid_selection(data, num_pts, tol, sample_size)
-        app_state_copy.background_points = automatic_points
-        return app_state_copy
+        cmd_args["previous_points"] = app_state.background_points.copy()
+        cmd_args["new_points"] = background_grid_selection(data, num_pts, tol, sample_size)
+        app_state.background_points = cmd_args["new_points"]
+        return app_state
+
+    def undo(self, cur_state: AppState, prev_state: AppState, cmd_args: Dict) -> AppState:
+        cur_state.background_points = cmd_args["previous_points"]
+        return cur_state
+
+    def redo(self, cur_state: AppState, next_state: AppState, cmd_args: Dict) -> AppState:
+        cur_state.background_points = cmd_args["new_points"]
+        return cur_state
 
-    def progress(self) -> float:
-        return 1.0
 
 class ResetPointsHandler(PointHandler):
     def execute(self, app_state: AppState, cmd_args: Dict) -> AppState:
-        app_state_copy = deepcopy(app_state)
-        app_state_copy.background_points.clear()
-        return app_state_copy
+        cmd_args["previous_points"] = app_state.background_points.copy()
+        app_state.background_points = []
+        return app_state
 
-    def progress(self) -> float:
-        return 1.0
+    def undo(self, cur_state: AppState, prev_state: AppState, cmd_args: Dict) -> AppState:
+        cur_state.background_points = cmd_args["previous_points"]
+        return cur_state
+
+    def redo(self, cur_state: AppState, next_state: AppState, cmd_args: Dict) -> AppState:
+        return self.execute(cur_state, cmd_args)
 
 
 INIT_HANDLER = InitHandler()
@@ -2,9 +2,8 @@ import copy
 import logging
 
 import numpy as np
-import onnxruntime as ort
 
-from graxpert.ai_model_handling import get_execution_providers_ordered
+from graxpert.ai_model_handling import get_execution_providers_ordered, get_inference_session
 from graxpert.application.app_events import AppEvents
 from graxpert.application.eventbus import eventbus
 
@@ -66,7 +65,7 @@ def deconvolve(image, ai_path, strength, psfsize, batch_size=4, window_size=512,
     output = copy.deepcopy(image)
 
     providers = get_execution_providers_ordered(ai_gpu_acceleration)
-    session = ort.InferenceSession(ai_path, providers=providers)
+    session = get_inference_session(ai_path, providers)
 
     logging.info(f"Available inference providers : {providers}")
     logging.info(f"Used inference providers : {session.get_providers()}")
@@ -3,9 +3,8 @@ import logging
 import time
 
 import numpy as np
-import onnxruntime as ort
 
-from graxpert.ai_model_handling import get_execution_providers_ordered
+from graxpert.ai_model_handling import get_execution_providers_ordered, get_inference_session
 from graxpert.application.app_events import AppEvents
 from graxpert.application.eventbus import eventbus
 from graxpert.ui.ui_events import UiEvents
@@ -67,7 +66,7 @@ def denoise(image, ai_path, strength, batch_size=4, window_size=256, stride=128,
     output = copy.deepcopy(image)
 
     providers = get_execution_providers_ordered(ai_gpu_acceleration)
-    session = ort.InferenceSession(ai_path, providers=providers)
+    session = get_inference_session(ai_path, providers)
 
     logging.info(f"Available inference providers : {providers}")
     logging.info(f"Used inference providers : {session.get_providers()}")
@@ -0,0 +1,72 @@
+import math
+
+import numpy as np
+from PIL import Image
+
+
+class DisplayPyramid:
+    """
+    Mip-map pyramid of a display image for drawing it at arbitrary zoom levels. Level k is the image reduced by a
+    factor of 2**k with box averaging; the levels are built on first use, each from the level above it.
+
+    render draws the image for a canvas with the affine transform mat_affine (image to canvas coordinates, scale and
+    translation only). It samples from the coarsest level that still has at least one pixel per canvas pixel and
+    only transforms the part of that level which is visible on the canvas, so the cost depends on the canvas size
+    instead of the image size, and zoomed out views are averaged instead of aliased.
+
+    Inputs
+    ------
+    image PIL.Image
+        Display image, i.e. level 0
+    """
+
+    def __init__(self, image):
+        self.levels = [image]
+
+    @property
+    def width(self):
+        return self.levels[0].width
+
+    @property
+    def height(self):
+        return self.levels[0].height
+
+    def level_index(self, scale):
+        """
+        Index of the level to draw from at a zoom of 'scale' canvas pixels per image pixel
+        """
+        k = int(math.floor(math.log2(1.0 / scale) + 1e-9))
+        # the coarsest level is a few pixels wide
+        return max(0, min(k, int(math.log2(max(self.width, self.height, 1)))))
+
+    def level(self, k):
+        while len(self.levels) <= k:
+            self.levels.append(self.levels[-1].reduce(2))
+        return self.levels[k]
+
+    def render(self, size, mat_affine):
+        """
+        The image as shown on a canvas of 'size' (width, height) pixels, with the canvas coordinates given by
+        mat_affine * image coordinates
+        """
+        k = self.level_index(abs(mat_affine[0, 0]))
+        level = self.level(k)
+        factor = 2**k
+
+        # canvas to level coordinates
+        mat_inv = np.linalg.inv(mat_affine)
+        mat_inv[:2] /= factor
+
+        # visible part of the level, with a margin of a pixel for rounding
+        corners = mat_inv.dot(np.array([[0, size[0], 0, size[0]], [0, 0, size[1], size[1]], [1, 1, 1, 1]]))
+        x0 = max(0, int(math.floor(np.min(corners[0]))) - 1)
+        y0 = max(0, int(math.floor(np.min(corners[1]))) - 1)
+        x1 = min(level.width, int(math.ceil(np.max(corners[0]))) + 1)
+        y1 = min(level.height, int(math.ceil(np.max(corners[1]))) + 1)
+
+        if x1 <= x0 or y1 <= y0:
+            return Image.new(level.mode, size)
+
+        # canvas to crop coordinates
+        affine_inv = (mat_inv[0, 0], mat_inv[0, 1], mat_inv[0, 2] - x0, mat_inv[1, 0], mat_inv[1, 1], mat_inv[1, 2] - y0)
+        return level.crop((x0, y0, x1, y1)).transform(size, Image.AFFINE, affine_inv, Image.NEAREST)
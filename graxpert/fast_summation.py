@@ -0,0 +1,210 @@
+import numpy as np
+import scipy.spatial
+
+
+class FastSummation:
+    """
+    Approximate fast evaluation of the kernel sum
+
+        s(x) = sum_{j=1}^N c_j * phi(||x - x_j||)
+
+    for kernels that are smooth away from r = 0, such as the thin plate
+    and other polyharmonic splines, in two dimensions.
+
+    The centers x_j are organized in a quadtree. Each node carries p*p
+    proxy charges on Chebyshev points of its bounding box, obtained by
+    interpolating the kernel in the source variable. The evaluation points
+    are split adaptively into boxes; for each box, nodes that are well
+    separated (multipole acceptance criterion (r_box + r_node) <= theta * d)
+    are summed through their proxy charges on p*p Chebyshev points of the
+    box and interpolated to the evaluation points. Only leaves close to the
+    box are summed directly, so the cost per evaluation point becomes nearly
+    independent of N.
+
+    Inputs
+    ------
+    centers (N,2) array
+        The build points x_j
+    coef (N,) or (N,k) array
+        The coefficients c_j
+    kernel callable
+        phi(r), must be smooth for r > 0
+    tol float
+        Requested accuracy of the far-field approximation, relative to the
+        range of s. Sets the interpolation order p
+    leaf_size int
+        Maximum number of centers in a leaf of the quadtree
+    theta float
+        Separation ratio of the multipole acceptance criterion
+    box_factor int
+        Boxes of evaluation points are only subdivided further while they
+        contain more than box_factor * p * p points
+    """
+
+    def __init__(self, centers, coef, kernel, tol, leaf_size=16, theta=0.7, box_factor=16):
+        self.kernel = kernel
+        self.theta = theta
+        self.leaf_size = leaf_size
+        self.box_factor = box_factor
+        self.order = FastSummation.interpolation_order(tol, theta)
+
+        centers = np.asarray(centers, dtype=float)
+        coef = np.asarray(coef, dtype=float)
+        self.ndim_coef = coef.ndim
+        coef = coef.reshape(len(centers), -1)
+
+        # nodes are stored in flat lists; the centers are reordered so that every node covers a contiguous range
+        self.node_start = []
+        self.node_end = []
+        self.node_lo = []
+        self.node_hi = []
+        self.node_children = []
+
+        order = np.arange(len(centers))
+        self.build_tree(centers, order, 0, len(centers))
+        self.centers = centers[order]
+        self.coef = coef[order]
+
+        self.node_lo = np.array(self.node_lo)
+        self.node_hi = np.array(self.node_hi)
+        self.node_center = (self.node_lo + self.node_hi) / 2
+        self.node_radius = np.linalg.norm(self.node_hi - self.node_lo, axis=1) / 2
+
+        # proxy points and charges of each node
+        self.node_proxies = []
+        self.node_charges = []
+        for n in range(len(self.node_start)):
+            sl = slice(self.node_start[n], self.node_end[n])
+            if self.node_end[n] - self.node_start[n] <= self.order**2:
+                # proxies would not be cheaper than the centers themselves
+                self.node_proxies.append(self.centers[sl])
+                self.node_charges.append(self.coef[sl])
+                continue
+            self.node_proxies.append(FastSummation.chebyshev_grid(self.node_lo[n], self.node_hi[n], self.order))
+            Lx, Ly = FastSummation.lagrange_basis(self.centers[sl], self.node_lo[n], self.node_hi[n], self.order)
+            self.node_charges.append(np.einsum("ja,jb,jk->abk", Lx, Ly, self.coef[sl]).reshape(self.order**2, -1))
+
+    @staticmethod
+    def interpolation_order(tol, theta):
+        # Chebyshev interpolation of a function analytic in the Bernstein ellipse given by the separation ratio theta
+        # converges like rho**-p
+        rho = (1 + np.sqrt(1 - theta**2)) / theta
+        return int(np.clip(np.ceil(np.log(1 / tol) / np.log(rho)) + 1, 3, 24))
+
+    def build_tree(self, centers, order, start, end):
+        node = len(self.node_start)
+        pts = centers[order[start:end]]
+        lo = pts.min(axis=0)
+        hi = pts.max(axis=0)
+
+        self.node_start.append(start)
+        self.node_end.append(end)
+        self.node_lo.append(lo)
+        self.node_hi.append(hi)
+        self.node_children.append([])
+
+        if end - start <= self.leaf_size or np.all(hi == lo):
+            return node
+
+        mid = (lo + hi) / 2
+        quadrant = (pts[:, 0] > mid[0]).astype(int) + 2 * (pts[:, 1] > mid[1]).astype(int)
+        sort = np.argsort(quadrant, kind="stable")
+        order[start:end] = order[start:end][sort]
+        bounds = start + np.searchsorted(quadrant[sort], np.arange(5))
+
+        for q in range(4):
+            if bounds[q + 1] > bounds[q]:
+                self.node_children[node].append(self.build_tree(centers, order, bounds[q], bounds[q + 1]))
+
+        return node
+
+    @staticmethod
+    def chebyshev_nodes(p):
+        return np.cos(np.pi * (2 * np.arange(p) + 1) / (2 * p))
+
+    @staticmethod
+    def chebyshev_grid(lo, hi, p):
+        t = FastSummation.chebyshev_nodes(p)
+        x = (lo[0] + hi[0]) / 2 + (hi[0] - lo[0]) / 2 * t
+        y = (lo[1] + hi[1]) / 2 + (hi[1] - lo[1]) / 2 * t
+        xx, yy = np.meshgrid(x, y, indexing="ij")
+        return np.stack([xx.ravel(), yy.ravel()], -1)
+
+    @staticmethod
+    def lagrange_basis(X, lo, hi, p):
+        # Lagrange polynomials on the Chebyshev nodes of the box, evaluated at X in the form
+        # L_a(t) = 1/p + 2/p * sum_{m=1}^{p-1} T_m(t_a) * T_m(t)
+        t = FastSummation.chebyshev_nodes(p)
+        weights = np.full(p, 2.0 / p)
+        weights[0] = 1.0 / p
+        Tt = np.cos(np.outer(np.arccos(t), np.arange(p))) * weights
+
+        L = []
+        for d in range(2):
+            half = (hi[d] - lo[d]) / 2
+            u = (X[:, d] - (lo[d] + hi[d]) / 2) / half if half > 0 else np.zeros(len(X))
+            T = np.cos(np.outer(np.arccos(np.clip(u, -1, 1)), np.arange(p)))
+            L.append(T.dot(Tt.T))
+        return L
+
+    def interaction_lists(self, lo, hi):
+        center = (lo + hi) / 2
+        radius = np.linalg.norm(hi - lo) / 2
+        far = []
+        near = []
+        stack = [0]
+        while stack:
+            n = stack.pop()
+            if radius + self.node_radius[n] <= self.theta * np.linalg.norm(center - self.node_center[n]):
+                far.append(n)
+            elif not self.node_children[n]:
+                near.append(n)
+            else:
+                stack.extend(self.node_children[n])
+        return far, near
+
+    def __call__(self, X, max_entries=2 * 10**6):
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        result = np.zeros((X.shape[0], self.coef.shape[1]))
+        if X.shape[0] > 0:
+            self.evaluate_box(X, np.arange(X.shape[0]), X.min(axis=0), X.max(axis=0), result, max_entries)
+        return result if self.ndim_coef > 1 else result[:, 0]
+
+    def evaluate_box(self, X, idx, lo, hi, result, max_entries):
+        far, near = self.interaction_lists(lo, hi)
+        near_idx = np.concatenate([np.arange(self.node_start[n], self.node_end[n]) for n in near]) if near else np.zeros(0, dtype=int)
+
+        # boxes with many targets and many direct interactions are subdivided, so that more of the sources become far field
+        num_nodes = self.order**2
+        if len(idx) > self.box_factor * num_nodes and len(near_idx) > num_nodes and np.any(hi > lo):
+            mid = (lo + hi) / 2
+            Xi = X[idx]
+            quadrant = (Xi[:, 0] > mid[0]).astype(int) + 2 * (Xi[:, 1] > mid[1]).astype(int)
+            for q in range(4):
+                sub = idx[quadrant == q]
+                if len(sub) > 0:
+                    self.evaluate_box(X, sub, X[sub].min(axis=0), X[sub].max(axis=0), result, max_entries)
+            return
+
+        if far:
+            proxies = np.concatenate([self.node_proxies[n] for n in far])
+            charges = np.concatenate([self.node_charges[n] for n in far])
+            if len(idx) > num_nodes:
+                # far field on Chebyshev points of the box, interpolated to the targets
+                values = self.direct(FastSummation.chebyshev_grid(lo, hi, self.order), proxies, charges, max_entries)
+                Lx, Ly = FastSummation.lagrange_basis(X[idx], lo, hi, self.order)
+                values = values.reshape(self.order, self.order, -1)
+                result[idx] += np.einsum("ja,jb,abk->jk", Lx, Ly, values)
+            else:
+                result[idx] += self.direct(X[idx], proxies, charges, max_entries)
+
+        if len(near_idx) > 0:
+            result[idx] += self.direct(X[idx], self.centers[near_idx], self.coef[near_idx], max_entries)
+
+    def direct(self, X, centers, coef, max_entries):
+        result = np.empty((X.shape[0], coef.shape[1]))
+        step_size = max(1, max_entries // max(1, len(centers)))
+        for start in range(0, X.shape[0], step_size):
+            end = min(start + step_size, X.shape[0])
+            result[start:end] = self.kernel(scipy.spatial.distance.cdist(X[start:end], centers)).dot(coef)
+        return result
@@ -3,8 +3,67 @@ import math
 
 import numpy as np
 
+# Memory budget (in bytes) for the stack of footprints whose medians are computed together in find_darkest_quadrants
+max_footprint_bytes = 128 * 1024**2
 
-def find_darkest_quadrant(x, y, data_padded, sample_size):
+# Luminance weights, as in skimage.color.rgb2gray
+luminance_weights = [0.2125, 0.7154, 0.0721]
+
+
+def reflect_indices(idx, n):
+    """
+    Map indices beyond the ends of an axis of length n to the values np.pad(..., mode="reflect") would place there
+    """
+    idx = np.asarray(idx)
+    if n == 1:
+        return np.zeros_like(idx)
+    period = 2 * (n - 1)
+    idx = np.mod(idx, period)
+    return np.where(idx >= n, period - idx, idx)
+
+
+def footprint(data, x, y, halfsize):
+    """
+    The box data_padded[y : y + 2 * halfsize, x : x + 2 * halfsize] of data_padded = np.pad(data, halfsize, mode="reflect"),
+    without padding the whole image: boxes inside the image are returned as views, only boxes crossing the border are
+    reflected
+    """
+    x0 = x - halfsize
+    y0 = y - halfsize
+    if x0 >= 0 and y0 >= 0 and x0 + 2 * halfsize <= data.shape[1] and y0 + 2 * halfsize <= data.shape[0]:
+        return data[y0 : y0 + 2 * halfsize, x0 : x0 + 2 * halfsize]
+
+    rows = reflect_indices(np.arange(y0, y0 + 2 * halfsize), data.shape[0])
+    cols = reflect_indices(np.arange(x0, x0 + 2 * halfsize), data.shape[1])
+    return data[np.ix_(rows, cols)]
+
+
+def inside_image(x, y, halfsize, shape):
+    # boxes that do not cross the border
+    return (x >= halfsize) & (y >= halfsize) & (x + halfsize <= shape[1]) & (y + halfsize <= shape[0])
+
+
+def footprints(data, x, y, halfsize):
+    """
+    Stack of the boxes footprint(data, x[i], y[i], halfsize) for arrays of coordinates x and y
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    result = np.empty((len(x), 2 * halfsize, 2 * halfsize), dtype=data.dtype)
+
+    # boxes inside the image are copied from a strided view of all boxes
+    inside = inside_image(x, y, halfsize, data.shape)
+    windows = np.lib.stride_tricks.sliding_window_view(data, (2 * halfsize, 2 * halfsize))
+    result[inside] = windows[y[inside] - halfsize, x[inside] - halfsize]
+
+    rows = reflect_indices(y[~inside, None] - halfsize + np.arange(2 * halfsize), data.shape[0])
+    cols = reflect_indices(x[~inside, None] - halfsize + np.arange(2 * halfsize), data.shape[1])
+    result[~inside] = data[rows[:, :, None], cols[:, None, :]]
+    return result
+
+
+def find_darkest_quadrant(x, y, data, sample_size):
+    # x and y are given in the coordinates of the image padded by sample_size, but the image itself is not padded
 
     cords = [
         [x + 0, y + 0],
@@ -17,18 +76,13 @@ def find_darkest_quadrant(x, y, data_padded, sample_size):
     for point in cords:
         if (
             point[0] < 0
-            or point[0] > (data_padded.shape[1] - 2 * sample_size)
+            or point[0] > data.shape[1]
             or point[1] < 0
-            or point[1] > (data_padded.shape[0] - 2 * sample_size)
+            or point[1] > data.shape[0]
         ):
             median.append(2)
         else:
-            m = np.median(
-                data_padded[
-                    point[1] : point[1] + 2 * sample_size,
-                    point[0] : point[0] + 2 * sample_size,
-                ]
-            )
+            m = np.median(footprint(data, point[0], point[1], sample_size))
             if math.isnan(m):
                 logging.error("computed median is NaN", stack_info=True)
             median.append(m)
@@ -36,3 +90,78 @@ def find_darkest_quadrant(x, y, data_padded, sample_size):
     min_idx = np.argmin(median)
 
     return cords[min_idx], median[min_idx]
+
+
+def batch_median(a):
+    """
+    np.median(a, axis=1), with a single partition per row: partitioning for both middle elements of an even number of
+    values at once takes several times longer in numpy than partitioning for the upper one and taking the maximum below it
+    """
+    n = a.shape[1]
+    part = np.partition(a, n // 2, axis=1)
+    # like np.median, integers are averaged as floats
+    dtype = a.dtype if np.issubdtype(a.dtype, np.floating) else np.float64
+    median = part[:, n // 2].astype(dtype)
+    if n % 2 == 0:
+        median = (median + np.max(part[:, : n // 2], axis=1).astype(dtype)) / 2
+    return np.where(np.any(np.isnan(a), axis=1), np.nan, median)
+
+
+def luminance(data, x, y, halfsize):
+    """
+    Luminance of a mono (H,W[,1]) or RGB (H,W,3) image, computed only for the rows of the footprints at x and y; the
+    other rows are left uninitialized
+    """
+    if data.ndim == 2:
+        return data
+    if data.shape[-1] == 1:
+        return data[:, :, 0]
+
+    height = data.shape[0]
+    needed = np.zeros(height + 1, dtype=int)
+    inside = (y >= halfsize) & (y + halfsize <= height)
+    np.add.at(needed, y[inside] - halfsize, 1)
+    np.add.at(needed, y[inside] + halfsize, -1)
+    needed = np.cumsum(needed[:-1]) > 0
+    needed[reflect_indices(y[~inside, None] - halfsize + np.arange(2 * halfsize), height)] = True
+
+    # contiguous runs of needed rows
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], needed, [False]]).astype(int)))
+    result = np.empty(data.shape[:2], dtype=data.dtype)
+    weights = np.array(luminance_weights, dtype=data.dtype)
+    for start, end in zip(edges[::2], edges[1::2]):
+        np.matmul(data[start:end], weights, out=result[start:end])
+    return result
+
+
+def find_darkest_quadrants(x, y, data, sample_size):
+    """
+    find_darkest_quadrant for arrays of points x and y at once, on a mono (H,W[,1]) or RGB (H,W,3) image. Returns
+    the selected points as an (N,2) int array and their medians
+    """
+    x = np.asarray(x, dtype=int)
+    y = np.asarray(y, dtype=int)
+    offsets = np.array([[0, 0], [1, 1], [-1, 1], [1, -1], [-1, -1]]) * sample_size
+    cords = np.stack([x, y], -1)[:, None, :] + offsets[None, :, :]
+    height, width = data.shape[:2]
+    valid = (cords[:, :, 0] >= 0) & (cords[:, :, 0] <= width) & (cords[:, :, 1] >= 0) & (cords[:, :, 1] <= height)
+
+    cx = cords[:, :, 0][valid]
+    cy = cords[:, :, 1][valid]
+    data_mono = luminance(data, cx, cy, sample_size)
+
+    values = np.empty(len(cx))
+    step_size = max(1, int(max_footprint_bytes // (2 * (2 * sample_size) ** 2 * data_mono.itemsize)))
+    for start in range(0, len(cx), step_size):
+        end = min(start + step_size, len(cx))
+        boxes = footprints(data_mono, cx[start:end], cy[start:end], sample_size)
+        values[start:end] = batch_median(boxes.reshape(end - start, -1))
+
+    if np.any(np.isnan(values)):
+        logging.error("computed median is NaN", stack_info=True)
+
+    median = np.full(valid.shape, 2.0)
+    median[valid] = values
+    min_idx = np.argmin(median, axis=1)
+    rows = np.arange(len(x))
+    return cords[rows, min_idx], median[rows, min_idx]
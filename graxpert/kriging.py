@@ -0,0 +1,205 @@
+import numpy as np
+import scipy.linalg
+import scipy.spatial
+from pykrige.variogram_models import spherical_variogram_model
+from scipy.optimize import least_squares
+
+# Memory budget (in bytes, per process) for the temporary arrays of one block of evaluation points in __call__
+max_evaluation_bytes = 128 * 1024**2
+
+# In local mode, the variogram is fitted to at most this many randomly chosen samples
+max_variogram_points = 2000
+
+
+class OrdinaryKrigingInterpolation:
+    """
+    Ordinary Kriging with a spherical variogram, for k sets of values sampled at the same points (e.g. the color
+    channels of an image). Follows pykrige's OrdinaryKriging with the "vectorized" backend, but
+
+    - the variogram is fitted once for all sets of values: the experimental semivariances of the sets are pooled
+      after normalizing each by its variance. The kriging weights only depend on the shape of the variogram, so
+      for a single set of values this gives the same result as fitting it alone
+    - the kriging system is inverted once and combined with the values, so that evaluation only needs the variogram
+      between the evaluation points and the samples and a matrix product
+
+    If 'neighbors' is given, a local (moving window) Kriging is used instead: the plane is divided into square
+    windows of 'window' pixels and each window is kriged from the 'neighbors' samples closest to its center, found
+    with a KD-tree. An evaluation point is kriged with the systems of the four windows whose centers surround it and
+    the results are weighted bilinearly by the position between the centers, so that the surface stays continuous
+    where the neighbor sets change. Only small local systems are solved, so the cost grows linearly with the number
+    of samples. With enough neighbors, the result matches global Kriging closely, as the weights of distant samples
+    are negligible.
+
+    Inputs
+    ------
+    X (N,2) array
+        Sample points
+    f (N,) or (N,k) array
+        Sampled values
+    nlags int
+        Number of bins for the experimental semivariogram
+    neighbors int
+        Number of samples per local system, None for global Kriging
+    window int
+        Size of the windows sharing a local system
+    """
+
+    def __init__(self, X, f, nlags=6, eps=1e-10, neighbors=None, window=16):
+        self.X = X = np.atleast_2d(np.asarray(X, dtype=float))
+        self.N = X.shape[0]
+        f = np.asarray(f, dtype=float)
+        F = f.reshape(self.N, -1)
+        self.eps = eps
+        self.local = neighbors is not None and neighbors < self.N
+
+        if self.local:
+            self.neighbors = max(2, neighbors)
+            self.window = window
+            self.tree = scipy.spatial.cKDTree(X)
+            self.F = F if f.ndim > 1 else F[:, 0]
+
+            fit_points = np.arange(self.N)
+            if self.N > max_variogram_points:
+                fit_points = np.random.default_rng(0).choice(self.N, max_variogram_points, replace=False)
+            self.variogram_model_parameters = OrdinaryKrigingInterpolation.fit_variogram(X[fit_points], F[fit_points], nlags)
+            return
+
+        self.variogram_model_parameters = OrdinaryKrigingInterpolation.fit_variogram(X, F, nlags)
+
+        d = scipy.spatial.distance.cdist(X, X)
+        a = np.zeros((self.N + 1, self.N + 1))
+        a[: self.N, : self.N] = -self.variogram(d)
+        np.fill_diagonal(a, 0.0)
+        a[self.N, :] = 1.0
+        a[:, self.N] = 1.0
+        a[self.N, self.N] = 0.0
+        a_inv = scipy.linalg.inv(a)
+
+        # the estimate at x is sum_i w_i(x) * f_i with the weights w = (a_inv * b(x))[:N], so a_inv can be
+        # combined with the values once
+        coef = a_inv[: self.N, :].T.dot(F)
+        self.coef = coef if f.ndim > 1 else coef[:, 0]
+
+    @staticmethod
+    def fit_variogram(X, F, nlags):
+        # binning of the lags as in pykrige
+        d = scipy.spatial.distance.pdist(X)
+        dmin = np.amin(d)
+        dmax = np.amax(d)
+        bins = [dmin + n * (dmax - dmin) / nlags for n in range(nlags)]
+        bins.append(dmax + 0.001)
+
+        variance = np.var(F, axis=0)
+        variance = np.where(variance > 0, variance, 1.0)
+        semivariance_channels = np.stack([0.5 * scipy.spatial.distance.pdist(F[:, c : c + 1], metric="sqeuclidean") for c in range(F.shape[1])], -1)
+        g = np.mean(semivariance_channels / variance, axis=1) * np.mean(variance)
+
+        lags = []
+        semivariance = []
+        for n in range(nlags):
+            in_bin = (d >= bins[n]) & (d < bins[n + 1])
+            if np.any(in_bin):
+                lags.append(np.mean(d[in_bin]))
+                semivariance.append(np.mean(g[in_bin]))
+        lags = np.array(lags)
+        semivariance = np.array(semivariance)
+
+        x0 = [np.amax(semivariance) - np.amin(semivariance), 0.25 * np.amax(lags), np.amin(semivariance)]
+        bnds = ([0.0, 0.0, 0.0], [10.0 * np.amax(semivariance), np.amax(lags), np.amax(semivariance)])
+        res = least_squares(lambda params: spherical_variogram_model(params, lags) - semivariance, x0, bounds=bnds, loss="soft_l1")
+
+        return res.x
+
+    def variogram(self, d):
+        return spherical_variogram_model(self.variogram_model_parameters, d)
+
+    def __call__(self, X, out=None, max_bytes=None):
+        X = np.atleast_2d(X)
+        if out is None:
+            out = np.empty((X.shape[0],) + (self.F if self.local else self.coef).shape[1:])
+
+        if self.local:
+            return self._call_local(X, out, max_bytes)
+
+        step_size = self.block_size(max_bytes=max_bytes)
+
+        for start in range(0, X.shape[0], step_size):
+            end = min(start + step_size, X.shape[0])
+            d = scipy.spatial.distance.cdist(X[start:end], self.X)
+            b = -self.variogram(d)
+            # exact values at the sample points
+            b[d <= self.eps] = 0.0
+            out[start:end] = b.dot(self.coef[: self.N]) + self.coef[self.N]
+
+        return out
+
+    def _call_local(self, X, out, max_bytes):
+        step_size = self.block_size(max_bytes=max_bytes)
+
+        # windows whose centers surround any of the evaluation points, numbered row by row within the bounding box
+        lower_min = np.floor(np.min(X, axis=0) / self.window - 0.5).astype(np.int64)
+        lower_max = np.floor(np.max(X, axis=0) / self.window - 0.5).astype(np.int64)
+        row_length = lower_max[0] - lower_min[0] + 2
+        corner_offsets = np.array([0, 1, row_length, row_length + 1])
+        cell_ids = [np.unique(self._window_ids(X[start : start + step_size], lower_min, row_length)[0]) for start in range(0, X.shape[0], step_size)]
+        cell_ids = np.unique(np.unique(np.concatenate(cell_ids))[:, None] + corner_offsets)
+        cells = np.stack([cell_ids % row_length, cell_ids // row_length], -1) + lower_min
+        _, window_neighbors = self.tree.query((cells + 0.5) * self.window, k=self.neighbors)
+
+        # local kriging systems, inverted in batches and combined with the values as in global Kriging
+        n = self.neighbors
+        F = self.F.reshape(self.N, -1)
+        coef = np.empty((len(cells), n + 1, F.shape[1]))
+        # distances with their temporaries, the system, its inverse and the variogram temporaries of each window
+        systems_step_size = max(1, int((max_bytes or max_evaluation_bytes) // (8 * 8 * (n + 1) ** 2)))
+        for start in range(0, len(cells), systems_step_size):
+            end = min(start + systems_step_size, len(cells))
+            pts = self.X[window_neighbors[start:end]]
+            d = np.linalg.norm(pts[:, :, None, :] - pts[:, None, :, :], axis=-1)
+            a = np.zeros((end - start, n + 1, n + 1))
+            a[:, :n, :n] = -self.variogram(d)
+            a[:, np.arange(n), np.arange(n)] = 0.0
+            a[:, n, :] = 1.0
+            a[:, :, n] = 1.0
+            a[:, n, n] = 0.0
+            a_inv = np.linalg.inv(a)
+            coef[start:end] = np.einsum("wij,wik->wjk", a_inv[:, :n, :], F[window_neighbors[start:end]])
+            pts = d = a = a_inv = None
+
+        for start in range(0, X.shape[0], step_size):
+            end = min(start + step_size, X.shape[0])
+            ids, t = self._window_ids(X[start:end], lower_min, row_length)
+            # bilinear weights of the four surrounding windows
+            corner_weights = [(1 - t[:, 0]) * (1 - t[:, 1]), t[:, 0] * (1 - t[:, 1]), (1 - t[:, 0]) * t[:, 1], t[:, 0] * t[:, 1]]
+            values = np.zeros((end - start, F.shape[1]))
+            for offset, weight in zip(corner_offsets, corner_weights):
+                w = np.searchsorted(cell_ids, ids + offset)
+                d = np.linalg.norm(X[start:end, None, :] - self.X[window_neighbors[w]], axis=-1)
+                b = -self.variogram(d)
+                # exact values at the sample points
+                b[d <= self.eps] = 0.0
+                values += weight[:, None] * (np.einsum("pi,pik->pk", b, coef[w, :n]) + coef[w, n])
+                d = b = None
+            out[start:end] = values.reshape(out[start:end].shape)
+
+        return out
+
+    def _window_ids(self, X, lower_min, row_length):
+        # number of the window whose center is the closest one to the lower left of each point, and the position of the
+        # point between that center and the next ones
+        grid = X / self.window - 0.5
+        lower = np.floor(grid)
+        ids = (lower[:, 1].astype(np.int64) - lower_min[1]) * row_length + lower[:, 0].astype(np.int64) - lower_min[0]
+        return ids, grid - lower
+
+    def block_size(self, dtype=np.float64, max_bytes=None):
+        # Kriging always evaluates in float64, dtype is accepted for the same interface as RadialBasisInterpolation
+        if max_bytes is None:
+            max_bytes = max_evaluation_bytes
+        # distances (and coordinate differences and gathered kriging coefficients in local mode), the variogram block
+        # with its temporaries and the mask of exact values
+        if self.local:
+            bytes_per_point = self.neighbors * (8 * (16 + 3 * self.F.reshape(self.N, -1).shape[1]) + 1)
+        else:
+            bytes_per_point = self.N * (8 * 4 + 1)
+        return max(1, int(max_bytes // bytes_per_point))
@@ -234,6 +234,30 @@ def main():
         bge_parser.add_argument("-correction", "--correction", nargs="?", required=False, default=None, choices=["Subtraction", "Division"], type=str, help="Subtraction or Division")
         bge_parser.add_argument("-smoothing", "--smoothing", nargs="?", required=False, default=None, type=float, help="Strength of smoothing between 0 and 1")
         bge_parser.add_argument("-bg", "--bg", required=False, action="store_true", help="Also save the background model")
+        bge_parser.add_argument(
+            "-downscale_factor",
+            "--downscale_factor",
+            nargs="?",
+            required=False,
+            default=None,
+            type=int,
+            help="Evaluate the RBF, Kriging or Splines background model at 1/downscale_factor of the image resolution, default: chosen from the image size and the spacing of the background points",
+        )
+        bge_parser.add_argument(
+            "additional_filenames",
+            nargs="*",
+            type=str,
+            help="Paths of further unprocessed images, e.g. the sub-frames of a sequence, given anywhere after the first filename. With the AI method, they are processed in batches of size '-batch_size'",
+        )
+        bge_parser.add_argument(
+            "-batch_size",
+            "--ai_batch_size",
+            nargs="?",
+            required=False,
+            default=None,
+            type=int,
+            help='Number of images which Graxpert will process in one AI inference call when several images are given. Be careful: increasing this value might result in out-of-memory errors. default: "4"',
+        )
 
         denoise_parser = argparse.ArgumentParser("GraXpert Denoising", parents=[parser], description="GraXpert, the astronomical denoising tool")
         denoise_parser.add_argument(
@@ -360,7 +384,8 @@ def main():
         args, extras = parser.parse_known_args()
 
         if args.command == "background-extraction":
-            args = bge_parser.parse_args()
+            # further filenames may follow the options, e.g. "GraXpert a.fits -cli b.fits"
+            args = bge_parser.parse_intermixed_args()
         elif args.command == "deconv-obj":
             args = deconv_obj_parser.parse_args()
         elif args.command == "deconv-stellar":
@@ -1,3 +1,7 @@
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-executor = ProcessPoolExecutor(max_workers=9)
+max_workers = 9
+executor = ProcessPoolExecutor(max_workers=max_workers)
+
+# for NumPy work which releases the GIL and needs no copies of its data
+thread_executor = ThreadPoolExecutor(max_workers=max_workers)
@@ -0,0 +1,91 @@
+import math
+
+
+class PointIndex:
+    """
+    Spatial hash of the background points, kept in step with AppState.background_points: the points are bucketed
+    into square cells of 'cell_size' pixels, so that hit tests and overlap checks only look at the points in the
+    cells around the query instead of all points. The index refers to the points by their position in the list, and
+    follows AppState in moving the last point into the place of a removed one, so that all updates are O(1).
+
+    Inputs
+    ------
+    points list of (x, y, ...) points
+        Initial points
+    cell_size int
+        Size of the cells in pixels
+    """
+
+    def __init__(self, points=(), cell_size=64):
+        self.cell_size = cell_size
+        self.points = []
+        self.cells = {}
+        for point in points:
+            self.add(point)
+
+    def __len__(self):
+        return len(self.points)
+
+    def cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def add(self, point):
+        x, y = float(point[0]), float(point[1])
+        self.cells.setdefault(self.cell(x, y), []).append(len(self.points))
+        self.points.append((x, y))
+
+    def remove_from_cell(self, idx):
+        x, y = self.points[idx]
+        bucket = self.cells[self.cell(x, y)]
+        bucket.remove(idx)
+        if not bucket:
+            del self.cells[self.cell(x, y)]
+
+    def remove(self, idx):
+        last = len(self.points) - 1
+        self.remove_from_cell(idx)
+        if idx != last:
+            # the last point takes the place of the removed one
+            self.remove_from_cell(last)
+            self.points[idx] = self.points[last]
+            self.cells.setdefault(self.cell(*self.points[idx]), []).append(idx)
+        self.points.pop()
+
+    def move(self, idx, point):
+        x, y = self.points[idx]
+        new_x, new_y = float(point[0]), float(point[1])
+        if self.cell(x, y) != self.cell(new_x, new_y):
+            self.remove_from_cell(idx)
+            self.cells.setdefault(self.cell(new_x, new_y), []).append(idx)
+        self.points[idx] = (new_x, new_y)
+
+    def query_box(self, x, y, half_size):
+        """
+        Indices of the points with |x_i - x| <= half_size and |y_i - y| <= half_size, in ascending order
+        """
+        cx0, cy0 = self.cell(x - half_size, y - half_size)
+        cx1, cy1 = self.cell(x + half_size, y + half_size)
+        result = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for i in self.cells.get((cx, cy), ()):
+                    px, py = self.points[i]
+                    if abs(px - x) <= half_size and abs(py - y) <= half_size:
+                        result.append(i)
+        result.sort()
+        return result
+
+    def nearest(self, x, y, max_dist):
+        """
+        Index of the point closest to (x, y) in the maximum norm, the first one on ties, or -1 if there is no point
+        within max_dist
+        """
+        min_idx = -1
+        min_dist = -1
+        for i in self.query_box(x, y, max_dist):
+            px, py = self.points[i]
+            dist = max(abs(px - x), abs(py - y))
+            if min_idx == -1 or dist < min_dist:
+                min_dist = dist
+                min_idx = i
+        return min_idx
@@ -30,10 +30,17 @@ class Prefs:
     smoothing_option: float = 0.0
     saveas_option: AnyStr = "32 bit Tiff"
     saveas_stretched: bool = False
+    stretch_backend: AnyStr = "threads"
     sample_size: int = 25
     sample_color: int = 55
     RBF_kernel: AnyStr = "thin_plate"
+    RBF_tolerance: float = 0.0
+    interpol_block_size: int = None
+    interpol_workers: int = None
+    kriging_neighbors: int = None
     spline_order: int = 3
+    spline_knots: int = None
+    downscale_factor: int = None
     lang: AnyStr = None
     corr_type: AnyStr = "Subtraction"
     scaling: float = 1.0
@@ -2,10 +2,97 @@ import sys
 if sys.version_info[0] >2:
     unicode = str
 
+from collections import OrderedDict
+
 import numpy as np
 import scipy.spatial
+import scipy.special
 from scipy.special import xlogy
 import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
+
+from graxpert.fast_summation import FastSummation
+
+
+# LRU cache of LU factorizations of the augmented RBF system, bounded by
+# the memory held by the factorized matrices
+max_cached_factorizations_bytes = 512 * 1024**2
+cached_factorizations = OrderedDict()
+
+# Compactly supported kernels. Their support radius is epsilon, so the
+# kernel matrix is sparse and the system is solved with a sparse LU
+compact_kernels = ['wendland_c0','wendland_c2','wendland_c4']
+
+# Average number of build points within the support radius if epsilon is
+# not given for a compactly supported kernel
+compact_support_neighbors = 50
+
+# Kernels that are evaluated with fast summation if a tolerance is given
+fast_summation_kernels = ['linear','cubic','quintic','thin_plate']
+
+# Memory budget (in bytes, per process) for the temporary arrays of one
+# block of evaluation points in __call__
+max_evaluation_bytes = 128 * 1024**2
+
+
+def factorization_key(X,kernel,epsilon,degree,smooth):
+    X = np.ascontiguousarray(X,dtype=float)
+    return (X.shape,X.tobytes(),kernel,epsilon,degree,float(smooth))
+
+
+def get_cached_factorization(key):
+    if key not in cached_factorizations:
+        return None
+    cached_factorizations.move_to_end(key)
+    return cached_factorizations[key][0]
+
+
+def cache_factorization(key,lu):
+    if isinstance(lu,SparseAugmentedFactorization):
+        nbytes = lu.nbytes
+    else:
+        nbytes = lu[0].nbytes
+    cached_factorizations[key] = (lu,nbytes)
+    cached_factorizations.move_to_end(key)
+    
+    total_size = sum(nbytes for _,nbytes in cached_factorizations.values())
+    while len(cached_factorizations) > 1 and total_size > max_cached_factorizations_bytes:
+        _,(_,nbytes) = cached_factorizations.popitem(last=False)
+        total_size -= nbytes
+
+
+def solve_factorization(lu,b):
+    if isinstance(lu,SparseAugmentedFactorization):
+        return lu.solve(b)
+    return scipy.linalg.lu_solve(lu,b)
+
+
+def clear_cached_factorizations():
+    cached_factorizations.clear()
+
+
+class SparseAugmentedFactorization:
+    """
+    Factorization of the augmented system (3) for a sparse, symmetric
+    positive definite kernel matrix K. K is factorized with a symmetric
+    mode sparse LU and the polynomial block is eliminated through its
+    small, dense Schur complement P.T * K^-1 * P
+    """
+    def __init__(self,K,P):
+        self.N = K.shape[0]
+        self.P = P
+        self.lu = scipy.sparse.linalg.splu(K.tocsc(),permc_spec='MMD_AT_PLUS_A',
+                                           diag_pivot_thresh=0,options=dict(SymmetricMode=True))
+        self.KinvP = self.lu.solve(P)
+        self.schur = scipy.linalg.lu_factor(P.T.dot(self.KinvP))
+        self.nbytes = (self.lu.L.nnz + self.lu.U.nnz) * (np.dtype(float).itemsize + np.dtype(np.int32).itemsize) + self.KinvP.nbytes
+
+    def solve(self,b):
+        Kinvf = self.lu.solve(b[:self.N])
+        g = scipy.linalg.lu_solve(self.schur,self.P.T.dot(Kinvf) - b[self.N:])
+        c = Kinvf - self.KinvP.dot(g)
+        return np.vstack([c,g])
 
 
 class RadialBasisInterpolation:
@@ -20,7 +107,9 @@ class RadialBasisInterpolation:
         (N,ndim) array or (N,) vector of build points
         
     f (array like)
-        (N,) vector of function values
+        (N,) vector of function values or (N,k) array of k sets of function
+        values (e.g. color channels) sharing the same build points. The
+        system is then factorized once and solved for all k right-hand sides
     
     Options: 
     --------
@@ -39,6 +128,13 @@ class RadialBasisInterpolation:
             'cubic': r**3
             'quintic': r**5
             'thin_plate': r**2 * log(r)
+            'wendland_c0': (1-r/epsilon)**2 for r < epsilon, else 0
+            'wendland_c2': (1-r/epsilon)**4 * (4*r/epsilon+1)
+            'wendland_c4': (1-r/epsilon)**6 * (35*(r/epsilon)**2+18*r/epsilon+3)/3
+            The Wendland kernels are compactly supported. The kernel matrix
+            is built from a KD-tree neighbor search and factorized as a
+            sparse matrix, and evaluation only visits build points within
+            epsilon, so fit and evaluation scale close to linearly with N
         If callable
             must take the arguments (r,epsilon) and ignore epsilon if 
             not needed. Tip: If epsilon is not needed, set it to
@@ -47,12 +143,23 @@ class RadialBasisInterpolation:
             Spline of the form: r**kernel if kernel is odd else r**kernel*log(r)
 
     epsilon [None]
-        Adjustable parameter for some kernels.
+        Adjustable parameter for some kernels. Defaults to 1, or for
+        compactly supported kernels to a support radius containing
+        about `compact_support_neighbors` build points on average.
         
-    smooth : float, optional
+    smooth : float or (k,) array, optional
         Values greater than zero increase the smoothness of the
         approximation.  0 is for interpolation (default). Actually set to
-        max(smooth,1e-10 * ||f||) for numerical precision
+        max(smooth,1e-10 * ||f||) for numerical precision. If given per
+        set of function values, one factorization is needed for each
+        distinct value
+
+    tol : float, optional
+        If greater than zero, polyharmonic kernels ('thin_plate', 'cubic',
+        'quintic', 'linear' or an integer) in two dimensions are evaluated
+        with a hierarchical fast summation (see `FastSummation`) instead of
+        the dense sum over all build points. The error is about tol times
+        the range of the interpolant. 0 evaluates exactly (default)
 
     Theory:
     ------
@@ -101,51 +208,156 @@ class RadialBasisInterpolation:
 
     """
     def __init__(self,X,f,degree=0,
-                 epsilon=1,smooth=0,
-                 kernel='gaussian',_solve=True):
+                 epsilon=None,smooth=0,
+                 kernel='gaussian',tol=0,_solve=True):
         self.X = X = np.atleast_2d(X)
         self.N,self.ndim = X.shape
-        self.f = f = np.ravel(f)
+        f = np.asarray(f)
+        self.f = f = f.reshape(self.N,-1) if f.ndim > 1 else np.ravel(f)
         self.degree = degree
         self.kernel = kernel
+        self.compact = isinstance(kernel,(str,unicode)) and self._kernel_name() in compact_kernels
+        if epsilon is None:
+            epsilon = self.default_support_radius() if self.compact else 1
         self.epsilon = epsilon
+        self.tree = scipy.spatial.cKDTree(X) if self.compact else None
         
-        
-        r = scipy.spatial.distance.cdist(X,X)
 
-        self.smooth = max(float(smooth),1e-10)
+        F = f.reshape(self.N,-1)
+        smooth = np.maximum(np.broadcast_to(np.asarray(smooth,dtype=float),(F.shape[1],)),1e-10)
+        self.smooth = smooth if f.ndim > 1 else float(smooth[0])
         
-        K = self._kernel(r) + np.eye(self.N)*self.smooth*np.mean(self._kernel(r))
         P = RadialBasisInterpolation.vandermond(X,degree=self.degree)
+        K = None
         
-        # Build the matrix
+        # Build the matrix and factorize it once for all right-hand sides
+        # sharing the same smoothing value. Factorizations are cached, so
+        # new function values for the same build points only cost a
+        # back-substitution
         Z = np.zeros([P.shape[1]]*2)
-        z = np.zeros(P.shape[1])
-        KP = np.block([[K   , P],
-                       [P.T , Z]])
-        b = np.hstack([f,z])
-        coef = scipy.linalg.solve(KP,b)
+        z = np.zeros([P.shape[1],F.shape[1]])
+        coef = np.empty([self.N + P.shape[1],F.shape[1]])
+        for s in np.unique(smooth):
+            cols = np.flatnonzero(smooth == s)
+            key = factorization_key(X,kernel,epsilon,degree,s)
+            lu = get_cached_factorization(key)
+            if lu is None and self.compact:
+                if K is None:
+                    K = self._sparse_kernel_matrix(X)
+                    K_mean = K.sum() / self.N**2
+                lu = SparseAugmentedFactorization(K + scipy.sparse.identity(self.N)*s*K_mean,P)
+                cache_factorization(key,lu)
+            elif lu is None:
+                if K is None:
+                    r = scipy.spatial.distance.cdist(X,X)
+                    K = self._kernel(r)
+                    K_mean = np.mean(K)
+                KP = np.block([[K + np.eye(self.N)*s*K_mean, P],
+                               [P.T                        , Z]])
+                lu = scipy.linalg.lu_factor(KP,overwrite_a=True)
+                cache_factorization(key,lu)
+            b = np.vstack([F[:,cols],z[:,cols]])
+            coef[:,cols] = solve_factorization(lu,b)
+        
+        if f.ndim == 1:
+            coef = coef[:,0]
         self.rbf_coef = coef[:self.N]
         self.poly_coef = coef[self.N:]
         
+        self.tol = tol
+        self.fast_summation = None
+        if tol > 0 and self.ndim == 2 and self._polyharmonic():
+            self.fast_summation = FastSummation(X,self.rbf_coef,self._kernel,tol)
+        
 
-    def __call__(self,X):
+    def __call__(self,X,out=None,dtype=np.float64,max_bytes=None):
+        """
+        Evaluate the interpolant at the (M,ndim) points X. The points are
+        processed in blocks sized by `block_size` so that the temporary
+        kernel and Vandermonde blocks stay within max_bytes (defaults to
+        `max_evaluation_bytes`). The result is written to out, an (M,) or
+        (M,k) array of any float type, if given. dtype=np.float32 evaluates
+        the kernel in single precision, which halves the memory of the
+        kernel blocks at the cost of accuracy, as the kernel sum cancels
+        large terms
+        """
         X = np.atleast_2d(X)
-        step_size = int(10*X.shape[0]/self.X.size + 1)
-        i = 0
-
-        result = np.empty(X.shape[0])
+        if out is None:
+            out = np.empty((X.shape[0],) + self.rbf_coef.shape[1:],dtype=dtype)
+        
+        rbf_coef = self.rbf_coef.astype(dtype,copy=False)
+        poly_coef = self.poly_coef.astype(dtype,copy=False)
+        step_size = self.block_size(dtype,max_bytes)
+        
+        for start in range(0,X.shape[0],step_size):
+            end = min(start+step_size,X.shape[0])
+            if self.compact:
+                K = self._sparse_kernel_matrix(X[start:end],dtype)
+            elif self.fast_summation is not None:
+                K = None
+                out[start:end] = self.fast_summation(X[start:end])
+            else:
+                r = scipy.spatial.distance.cdist(X[start:end],self.X)
+                K = self._kernel(r.astype(dtype,copy=False))
+            P = RadialBasisInterpolation.vandermond(X[start:end],degree=self.degree).astype(dtype,copy=False)
+            
+            if isinstance(K,np.ndarray) and out.flags.c_contiguous and out.dtype == K.dtype:
+                np.dot(K,rbf_coef,out=out[start:end])
+            elif K is not None:
+                out[start:end] = K.dot(rbf_coef)
+            out[start:end] += P.dot(poly_coef)
+            
+            # free the blocks before the next ones are allocated, so that only one block is held at a time
+            r = K = P = None
+        
+        return out
 
-        while(i < X.shape[0]):
-            start = i
-            end = np.minimum(i+step_size,X.shape[0])
-            K = self._kernel( scipy.spatial.distance.cdist(X[start:end],self.X) )
-            P = RadialBasisInterpolation.vandermond(X[start:end],degree=self.degree)
-           
-            result[start:end] = K.dot(self.rbf_coef) + P.dot(self.poly_coef)
-            i = i + step_size
+    def block_size(self,dtype=np.float64,max_bytes=None):
+        """
+        Number of evaluation points per block in __call__, such that the
+        temporary arrays of a block take about max_bytes
+        """
+        if max_bytes is None:
+            max_bytes = max_evaluation_bytes
+        itemsize = np.dtype(dtype).itemsize
+        num_poly = len(RadialBasisInterpolation.total_index(self.degree,self.ndim))
+        
+        # Vandermonde block, its float64 intermediates and the evaluation points
+        bytes_per_point = 8 * (2*num_poly + self.degree + 1 + self.ndim)
+        if self.compact:
+            # neighbor pairs (two indices and the distance) and the kernel values
+            neighbors = max(1.0,self.tree.count_neighbors(self.tree,self.epsilon) / self.N)
+            bytes_per_point += int(neighbors * (3*8 + 2*itemsize))
+        elif self.fast_summation is not None:
+            # kernel blocks within the fast summation are bounded separately
+            bytes_per_point += 8 * 16 * self.rbf_coef.reshape(self.N,-1).shape[1]
+        else:
+            # float64 distances, their copy in dtype, and the kernel block with its temporary
+            bytes_per_point += self.N * (8 + (itemsize if itemsize != 8 else 0) + 2*itemsize)
         
-        return result
+        return max(1,int(max_bytes // bytes_per_point))
+
+    def _sparse_kernel_matrix(self,X,dtype=np.float64):
+        # Only build points within the support radius contribute, so the
+        # kernel is evaluated on the sparse neighbor pairs
+        tree = self.tree if X is self.X else scipy.spatial.cKDTree(X)
+        pairs = tree.sparse_distance_matrix(self.tree,self.epsilon,output_type='ndarray')
+        K = self._kernel(pairs['v'].astype(dtype,copy=False))
+        return scipy.sparse.coo_matrix((K,(pairs['i'],pairs['j'])),shape=(X.shape[0],self.N))
+
+    def default_support_radius(self):
+        extent = np.ptp(self.X,axis=0)
+        extent = np.where(extent > 0,extent,np.max(extent,initial=1.0))
+        unit_ball = np.pi**(self.ndim/2) / scipy.special.gamma(self.ndim/2 + 1)
+        return (compact_support_neighbors * np.prod(extent) / (self.N * unit_ball))**(1.0/self.ndim)
+
+    def _polyharmonic(self):
+        if isinstance(self.kernel,(int,np.integer)):
+            return True
+        return isinstance(self.kernel,(str,unicode)) and self._kernel_name() in fast_summation_kernels
+
+    def _kernel_name(self):
+        return self.kernel.lower().replace(' ','_').replace('-','_')
 
     def _kernel(self,r):
         r = np.asarray(r)
@@ -159,7 +371,7 @@ class RadialBasisInterpolation:
         elif not isinstance(self.kernel,(str,unicode)):
             raise ValueError('Kernel must be a callable with signature (r,epsilon), an integer (spline) or a valid string')
         
-        kernel = self.kernel.lower().replace(' ','_').replace('-','_')
+        kernel = self._kernel_name()
         
         if kernel in ['multiquadric']:
             return np.sqrt((r/self.epsilon)**2 + 1)
@@ -175,6 +387,15 @@ class RadialBasisInterpolation:
             return r**5
         elif kernel in ['thin_plate']:
             return xlogy(r**2, r)
+        elif kernel in ['wendland_c0']:
+            q = np.maximum(1 - r/self.epsilon,0)
+            return q**2
+        elif kernel in ['wendland_c2']:
+            q = np.minimum(r/self.epsilon,1)
+            return (1-q)**4 * (4*q+1)
+        elif kernel in ['wendland_c4']:
+            q = np.minimum(r/self.epsilon,1)
+            return (1-q)**6 * (35*q**2+18*q+3)/3
         else:
             raise ValueError('Not valid kernel name')
     
@@ -8,10 +8,16 @@ from multiprocessing import shared_memory
 import numpy as np
 
 from graxpert.mp_logging import get_logging_queue, worker_configurer
-from graxpert.parallel_processing import executor
+from graxpert.parallel_processing import executor, thread_executor
 
 from dataclasses import dataclass
 
+# number of levels of the quantized images the display stretch is applied to
+lut_size = 65536
+
+# number of pixels per task of the thread backend
+stretch_block_pixels = 2**20
+
 @dataclass
 class MTFStretchParameters:
     midtone: float
@@ -52,15 +58,58 @@ class StretchParameters:
 
     
 
-def stretch(data, stretch_params: StretchParameters):
+def stretch(data, stretch_params: StretchParameters, backend="threads"):
     if not stretch_params.do_stretch:
         return data
     
     mtf_stretch_param = calculate_mtf_stretch_parameters_for_image(stretch_params, data)
-    return stretch_all([data], [mtf_stretch_param])[0]
+    return stretch_all([data], [mtf_stretch_param], backend)[0]
+
+
+def stretch_all(datas, mtf_stretch_params: list[MTFStretchParameters], backend="threads", in_place=False):
+    # backend "threads" stretches blocks of rows in a thread pool without copying the images, "processes" stretches copies
+    # of the channels in the process pool; in_place is only supported by the thread backend. The display is stretched
+    # with lookup tables (display_stretch), so the backend only concerns stretch(), i.e. saving stretched images
+    if backend == "threads":
+        return stretch_all_threads(datas, mtf_stretch_params, in_place)
+    elif in_place:
+        raise ValueError("The {} stretch backend cannot stretch in place".format(backend))
+    else:
+        return stretch_all_processes(datas, mtf_stretch_params)
+
+
+def stretch_all_threads(datas, mtf_stretch_params: list[MTFStretchParameters], in_place=False):
+    # the images are stretched in blocks of rows by the thread pool, either in place or into one output per image
+    futures = []
+    result = []
+
+    for data, mtf_stretch_param in zip(datas, mtf_stretch_params):
+        out = data if in_place else np.empty_like(data)
+        result.append(out)
+
+        block_rows = max(1, stretch_block_pixels // (data.shape[1] * data.shape[2]))
+        for row_start in range(0, data.shape[0], block_rows):
+            futures.append(thread_executor.submit(stretch_rows, data, out, mtf_stretch_param, row_start, row_start + block_rows))
+
+    for future in futures:
+        future.result()
+
+    return result
 
 
-def stretch_all(datas, mtf_stretch_params: list[MTFStretchParameters]):
+def stretch_rows(data, out, mtf_stretch_params, row_start, row_end):
+    # same as stretch_channel, for the rows [row_start, row_end) of all channels
+    for c in range(data.shape[-1]):
+        shadow_clipping = mtf_stretch_params[c].shadow_clipping
+        highlight_clipping = mtf_stretch_params[c].highlight_clipping
+
+        channel = np.subtract(data[row_start:row_end, :, c], shadow_clipping, dtype=data.dtype.type)
+        channel /= highlight_clipping - shadow_clipping
+        np.clip(channel, 0.0, 1.0, out=channel)
+        out[row_start:row_end, :, c] = MTF(channel, mtf_stretch_params[c].midtone)
+
+
+def stretch_all_processes(datas, mtf_stretch_params: list[MTFStretchParameters]):
     
     futures = []
     shms = []
@@ -90,6 +139,47 @@ def stretch_all(datas, mtf_stretch_params: list[MTFStretchParameters]):
     return result
 
 
+def quantize(data):
+    """
+    16 bit view of an image with values in [0, 1] for the display stretch
+    """
+    quantized = np.clip(data, 0.0, 1.0)
+    quantized *= lut_size - 1
+    np.rint(quantized, out=quantized)
+    return quantized.astype(np.uint16)
+
+
+def stretch_lut(mtf_stretch_params: MTFStretchParameters):
+    """
+    8 bit display values of the quantized values 0, ..., lut_size - 1, stretched like stretch_channel. Without
+    stretch parameters the values are only scaled
+    """
+    lut = np.linspace(0.0, 1.0, lut_size)
+
+    if mtf_stretch_params is not None:
+        shadow_clipping = mtf_stretch_params.shadow_clipping
+        highlight_clipping = mtf_stretch_params.highlight_clipping
+        lut = np.clip((lut - shadow_clipping) / (highlight_clipping - shadow_clipping), 0.0, 1.0)
+        lut = MTF(lut, mtf_stretch_params.midtone)
+
+    return (np.clip(lut, 0.0, 1.0) * 255).astype(np.uint8)
+
+
+def display_stretch(quantized, mtf_stretch_params: list[MTFStretchParameters]):
+    """
+    8 bit display image of a quantized image, stretched with lookup tables. mtf_stretch_params holds the parameters
+    per channel, or is None to only scale the values
+    """
+    if mtf_stretch_params is None or all(p == mtf_stretch_params[0] for p in mtf_stretch_params):
+        lut = stretch_lut(None if mtf_stretch_params is None else mtf_stretch_params[0])
+        return lut[quantized]
+
+    display = np.empty(quantized.shape, dtype=np.uint8)
+    for c in range(quantized.shape[-1]):
+        display[:, :, c] = stretch_lut(mtf_stretch_params[c])[quantized[:, :, c]]
+    return display
+
+
 def calculate_mtf_stretch_parameters_for_image(stretch_params, image):
     if stretch_params.channels_linked:
         mtf_stretch_param = calculate_mtf_stretch_parameters_for_channel(stretch_params, image)
@@ -105,6 +195,49 @@ def calculate_mtf_stretch_parameters_for_channel(stretch_params, channel):
     median = np.median(channel[indx_clip])
     mad = np.median(np.abs(channel[indx_clip]-median))
     
+    return mtf_stretch_parameters(stretch_params, median, mad)
+
+
+def channel_histograms(quantized, block_rows=256):
+    """
+    Histograms of the channels of a quantized image with lut_size bins, shape (channels, lut_size), in one pass over
+    blocks of rows
+    """
+    channels = quantized.shape[-1]
+    offsets = np.arange(channels, dtype=np.intp) * lut_size
+    histograms = np.zeros(channels * lut_size, dtype=np.int64)
+    for start in range(0, quantized.shape[0], block_rows):
+        block = quantized[start : start + block_rows] + offsets
+        histograms += np.bincount(block.ravel(), minlength=channels * lut_size)
+    return histograms.reshape(channels, lut_size)
+
+
+def calculate_mtf_stretch_parameters_from_histograms(stretch_params, histograms):
+    if stretch_params.channels_linked:
+        mtf_stretch_param = calculate_mtf_stretch_parameters_from_histogram(stretch_params, np.sum(histograms, axis=0))
+        return [mtf_stretch_param] * len(histograms)
+
+    else:
+        return [calculate_mtf_stretch_parameters_from_histogram(stretch_params, histogram) for histogram in histograms]
+
+def calculate_mtf_stretch_parameters_from_histogram(stretch_params, histogram):
+    # like calculate_mtf_stretch_parameters_for_channel, with the values quantized to the bins of the histogram
+    histogram = np.copy(histogram)
+    histogram[0] = 0
+    histogram[-1] = 0
+    cumulative = np.cumsum(histogram)
+    half = cumulative[-1] / 2
+
+    median = np.searchsorted(cumulative, half)
+
+    # the MAD is the smallest distance d with at least half of the values in [median - d, median + d]
+    d = np.arange(lut_size)
+    inside = cumulative[np.minimum(median + d, lut_size - 1)] - np.where(median - d > 0, cumulative[np.maximum(median - d - 1, 0)], 0)
+    mad = np.searchsorted(inside, half)
+
+    return mtf_stretch_parameters(stretch_params, median / (lut_size - 1), mad / (lut_size - 1))
+
+def mtf_stretch_parameters(stretch_params, median, mad):
     shadow_clipping = np.clip(median - stretch_params.sigma*mad, 0, 1.0)
     highlight_clipping = 1.0
     midtone = MTF((median-shadow_clipping)/(highlight_clipping - shadow_clipping), stretch_params.bg)
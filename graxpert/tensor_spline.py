@@ -0,0 +1,86 @@
+import numpy as np
+import scipy.linalg
+from scipy.interpolate import BSpline
+
+
+class TensorProductSpline:
+    """
+    Least-squares tensor-product B-spline surface on a fixed, uniform knot lattice, for k sets of values sampled at
+    the same points (e.g. the color channels of an image).
+
+    Unlike FITPACK's bisplrep, there is no knot search: the spline coefficients are the solution of one small,
+    direct least-squares problem with (knots + order + 1)**2 unknowns, so fitting takes a predictable time
+    regardless of the number of points. A second-order difference penalty on the coefficients (P-spline) provides
+    the smoothing and keeps coefficients of knot cells without samples well defined.
+
+    Inputs
+    ------
+    x, y (N,) arrays
+        Sample points
+    f (N,) or (N,k) array
+        Sampled values
+    domain ((x_min, x_max), (y_min, y_max))
+        Rectangle covered by the knot lattice, must contain the sample and evaluation points
+    knots int or (int, int)
+        Number of interior knots along x and y
+    order int
+        Order of the B-splines
+    smoothing float
+        Weight of the difference penalty relative to the data term. Values below 0.01 are raised to 0.01, which keeps
+        the surface from oscillating where the lattice is sparsely sampled
+    """
+
+    def __init__(self, x, y, f, domain, knots=8, order=3, smoothing=0.0):
+        f = np.asarray(f, dtype=float)
+        F = f.reshape(len(x), -1)
+        self.order = order
+        knots = np.broadcast_to(knots, (2,))
+
+        self.tx = TensorProductSpline.knot_vector(domain[0], knots[0], order)
+        self.ty = TensorProductSpline.knot_vector(domain[1], knots[1], order)
+        self.nx = len(self.tx) - order - 1
+        self.ny = len(self.ty) - order - 1
+
+        A = self.design_matrix(x, y)
+        AtA = A.T.dot(A)
+
+        # second-order differences of the coefficients along x and y
+        Dx = np.diff(np.eye(self.nx), 2, axis=0)
+        Dy = np.diff(np.eye(self.ny), 2, axis=0)
+        P = np.kron(Dx.T.dot(Dx), np.eye(self.ny)) + np.kron(np.eye(self.nx), Dy.T.dot(Dy))
+        scale = np.trace(AtA) / max(np.trace(P), 1.0)
+        lam = max(smoothing, 1e-2) * scale
+
+        coef = scipy.linalg.solve(AtA + lam * P, A.T.dot(F), assume_a="pos")
+        self.coef = coef.reshape((self.nx, self.ny) + f.shape[1:])
+
+    @staticmethod
+    def knot_vector(interval, knots, order):
+        # equally spaced knots continued beyond the interval, so that linear functions lie in the null space of the
+        # difference penalty
+        h = (interval[1] - interval[0]) / (knots + 1)
+        return interval[0] + h * np.arange(-order, knots + 2 + order)
+
+    def basis(self, x, t):
+        x = np.clip(x, t[self.order], t[-self.order - 1]).astype(float)
+        return BSpline.design_matrix(x, t, self.order).toarray()
+
+    def design_matrix(self, x, y):
+        Bx = self.basis(x, self.tx)
+        By = self.basis(y, self.ty)
+        return (Bx[:, :, None] * By[:, None, :]).reshape(len(x), -1)
+
+    def __call__(self, x, y):
+        """
+        Evaluate at the points (x, y)
+        """
+        return self.design_matrix(x, y).dot(self.coef.reshape(self.nx * self.ny, -1)).reshape((len(x),) + self.coef.shape[2:])
+
+    def grid(self, x, y):
+        """
+        Evaluate on the grid spanned by x and y, separably: the result of shape (len(y), len(x)[, k]) is
+        By * C * Bx^T per channel
+        """
+        Bx = self.basis(x, self.tx)
+        By = self.basis(y, self.ty)
+        return np.einsum("ya,xb,ba...->yx...", By, Bx, self.coef, optimize=True)
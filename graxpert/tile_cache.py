@@ -0,0 +1,76 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+class TileCache:
+    """
+    Cache of rendered display tiles, so that panning back over a visited region or switching back to a previously
+    shown image only pastes tiles together instead of rendering the canvas again.
+
+    At a zoom of 'scale' canvas pixels per image pixel, the zoomed image is divided into square tiles of 'tile_size'
+    pixels, rendered from the display pyramid of the image. Tiles are keyed by (display key, scale, tile column,
+    tile row), where the display key identifies what is shown, e.g. the image type, its pixels, stretch and
+    saturation. The least recently used tiles are evicted when the tiles take more than 'budget' bytes.
+
+    Inputs
+    ------
+    budget int
+        Memory budget in bytes
+    tile_size int
+        Size of the tiles in canvas pixels
+    """
+
+    def __init__(self, budget=256 * 1024**2, tile_size=256):
+        self.budget = budget
+        self.tile_size = tile_size
+        self.tiles = OrderedDict()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def clear(self):
+        self.tiles.clear()
+        self.nbytes = 0
+
+    def tile(self, key, render):
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
+
+        tile = render()
+        self.tiles[key] = tile
+        self.nbytes += tile.width * tile.height * len(tile.getbands())
+        while self.nbytes > self.budget and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.nbytes -= evicted.width * evicted.height * len(evicted.getbands())
+        return tile
+
+    def render(self, display_key, display_pyramid, size, mat_affine):
+        """
+        The image as shown on a canvas of 'size' (width, height) pixels, with the canvas coordinates given by
+        mat_affine * image coordinates. The translation is rounded to whole canvas pixels, so that tiles line up
+        """
+        # the scale is rounded so that zooming back and forth yields the same key
+        scale = round(abs(mat_affine[0, 0]), 6)
+        offset_x = round(mat_affine[0, 2])
+        offset_y = round(mat_affine[1, 2])
+        t = self.tile_size
+
+        # tiles intersecting both the canvas and the zoomed image
+        i0 = max(math.floor(-offset_x / t), 0)
+        j0 = max(math.floor(-offset_y / t), 0)
+        i1 = min(math.floor((size[0] - 1 - offset_x) / t), math.ceil(display_pyramid.width * scale / t) - 1)
+        j1 = min(math.floor((size[1] - 1 - offset_y) / t), math.ceil(display_pyramid.height * scale / t) - 1)
+
+        dst = Image.new(display_pyramid.levels[0].mode, size)
+        for j in range(j0, j1 + 1):
+            for i in range(i0, i1 + 1):
+                tile_affine = np.array([[scale, 0.0, -i * t], [0.0, scale, -j * t], [0.0, 0.0, 1.0]])
+                tile = self.tile((display_key, scale, i, j), lambda: display_pyramid.render((t, t), tile_affine))
+                dst.paste(tile, (i * t + offset_x, j * t + offset_y))
+        return dst
@@ -1,5 +1,7 @@
+import logging
 import tkinter as tk
 from colorsys import hls_to_rgb
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import messagebox
 
 import numpy as np
@@ -13,10 +15,14 @@ from graxpert.AstroImageRepository import ImageTypes
 from graxpert.commands import ADD_POINT_HANDLER, ADD_POINTS_HANDLER, MOVE_POINT_HANDLER, Command
 from graxpert.localization import _
 from graxpert.resource_utils import resource_path
+from graxpert.tile_cache import TileCache
 from graxpert.ui.loadingframe import DynamicProgressFrame, LoadingFrame
 from graxpert.ui.ui_events import UiEvents
 from graxpert.ui.widgets import default_option_menu_height
 
+# milliseconds between two frames; all view changes within a frame are drawn together
+frame_interval = 16
+
 
 class Canvas(CTkFrame):
     def __init__(self, master, **kwargs):
@@ -34,6 +40,28 @@ class Canvas(CTkFrame):
         self.endy = 0
         self.crop_mode = False
         self.clicked_inside_pt = False
+        # position of the point being dragged; the app state is only changed by the MOVE command on release
+        self.dragged_point = None
+
+        # canvas rectangles of the sample boxes, reused between redraws: the first num_samples_shown are shown at
+        # sample_coords, the others are hidden
+        self.sample_items = []
+        self.sample_coords = np.zeros((0, 4))
+        self.num_samples_shown = 0
+        self.sample_outline = None
+
+        # redraws are coalesced to one per frame interval and rendered by a worker thread, which alone uses the tile
+        # cache. view is the last requested view, frame_request the view still to be rendered, frame_rendering the one
+        # being rendered and frame the last rendered one, as (display key, canvas size, mat_affine[, display pyramid or
+        # image])
+        self.tile_cache = TileCache()
+        self.render_executor = ThreadPoolExecutor(max_workers=1)
+        self.redraw_scheduled = False
+        self.view = None
+        self.frame_request = None
+        self.frame_rendering = None
+        self.frame_future = None
+        self.frame = None
 
         self.create_children()
         self.setup_layout()
@@ -282,31 +310,18 @@ class Canvas(CTkFrame):
             return
 
         self.clicked_inside_pt = False
+        self.dragged_point = None
         point_im = graxpert.to_image_point(event.x, event.y)
 
         if len(graxpert.cmd.app_state.background_points) != 0 and len(point_im) != 0 and graxpert.prefs.display_pts:
             eventx_im = point_im[0]
             eventy_im = point_im[1]
 
-            background_points = graxpert.cmd.app_state.background_points
-
-            min_idx = -1
-            min_dist = -1
-
-            for i in range(len(background_points)):
-                x_im = background_points[i][0]
-                y_im = background_points[i][1]
-
-                dist = np.max(np.abs([x_im - eventx_im, y_im - eventy_im]))
+            min_idx = graxpert.cmd.app_state.point_index.nearest(eventx_im, eventy_im, graxpert.prefs.sample_size)
 
-                if min_idx == -1 or dist < min_dist:
-                    min_dist = dist
-                    min_idx = i
-
-            if min_idx != -1 and min_dist <= graxpert.prefs.sample_size:
+            if min_idx != -1:
                 self.clicked_inside_pt = True
                 self.clicked_inside_pt_idx = min_idx
-                self.clicked_inside_pt_coord = graxpert.cmd.app_state.background_points[min_idx]
 
         if self.crop_mode:
             # Check if inside circles to move crop corners
@@ -341,7 +356,7 @@ class Canvas(CTkFrame):
         if self.clicked_inside_pt and graxpert.prefs.display_pts and not self.crop_mode:
             new_point = graxpert.to_image_point(event.x, event.y)
             if len(new_point) != 0:
-                graxpert.cmd.app_state.background_points[self.clicked_inside_pt_idx] = new_point
+                self.dragged_point = new_point
 
             self.redraw_points()
 
@@ -376,7 +391,7 @@ class Canvas(CTkFrame):
 
         if self.clicked_inside_pt and not self.crop_mode:
             new_point = graxpert.to_image_point(event.x, event.y)
-            graxpert.cmd.app_state.background_points[self.clicked_inside_pt_idx] = self.clicked_inside_pt_coord
+            self.dragged_point = None
             graxpert.cmd = Command(MOVE_POINT_HANDLER, prev=graxpert.cmd, new_point=new_point, idx=self.clicked_inside_pt_idx)
             graxpert.cmd.execute()
 
@@ -465,27 +480,89 @@ class Canvas(CTkFrame):
     def draw_image(self, pil_image, tags=None):
         if pil_image is None:
             return
-        canvas_width = self.canvas.winfo_width()
-        canvas_height = self.canvas.winfo_height()
 
-        mat_inv = np.linalg.inv(graxpert.mat_affine)
+        im = ImageTk.PhotoImage(image=pil_image)
 
-        affine_inv = (mat_inv[0, 0], mat_inv[0, 1], mat_inv[0, 2], mat_inv[1, 0], mat_inv[1, 1], mat_inv[1, 2])
-
-        dst = pil_image.transform((canvas_width, canvas_height), Image.AFFINE, affine_inv, Image.NEAREST)
-
-        im = ImageTk.PhotoImage(image=dst)
-
-        self.canvas.create_image(0, 0, anchor=tk.NW, image=im, tags=tags)
+        self.canvas.delete("image")
+        self.canvas.create_image(0, 0, anchor=tk.NW, image=im, tags=("image", tags) if tags else "image")
+        self.canvas.tag_lower("image")
 
         self.image = im
-        self.redraw_points()
         return
 
     def redraw_image(self, event=None):
-        if graxpert.images.get(self.display_type.get()) is None:
+        # the image is redrawn at the end of the frame interval
+        if not self.redraw_scheduled:
+            self.redraw_scheduled = True
+            self.canvas.after(frame_interval, self.render_frame)
+
+    def render_frame(self):
+        self.redraw_scheduled = False
+        image = graxpert.images.get(self.display_type.get())
+        if image is None:
             return
-        self.draw_image(graxpert.images.get(self.display_type.get()).img_display_saturated)
+
+        display_key = (self.display_type.get(), image.display_key)
+        size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+        mat_affine = graxpert.mat_affine.copy()
+        self.redraw_points()
+
+        self.view = (display_key, size, mat_affine)
+        if Canvas.same_view(self.frame, self.view):
+            self.draw_image(self.frame[3])
+            self.frame_request = None
+            return
+
+        self.frame_request = self.view + (image.get_display_pyramid(),)
+        self.draw_preview()
+        if self.frame_future is None:
+            self.start_rendering()
+
+    @staticmethod
+    def same_view(a, b):
+        return a is not None and b is not None and a[:2] == b[:2] and np.array_equal(a[2], b[2])
+
+    def draw_preview(self):
+        # until the requested frame is rendered, the last frame of the same image is shown moved and scaled to the
+        # requested view
+        if self.frame is None or self.frame[0] != self.view[0]:
+            return
+        size, mat_affine = self.view[1:3]
+        mat_inv = self.frame[2].dot(np.linalg.inv(mat_affine))
+        affine_inv = (mat_inv[0, 0], mat_inv[0, 1], mat_inv[0, 2], mat_inv[1, 0], mat_inv[1, 1], mat_inv[1, 2])
+        self.draw_image(self.frame[3].transform(size, Image.AFFINE, affine_inv, Image.NEAREST))
+
+    def start_rendering(self):
+        display_key, size, mat_affine, display_pyramid = self.frame_request
+        self.frame_request = None
+        self.frame_rendering = (display_key, size, mat_affine)
+        self.frame_future = self.render_executor.submit(self.tile_cache.render, display_key, display_pyramid, size, mat_affine)
+        self.canvas.after(frame_interval, self.poll_frame)
+
+    def poll_frame(self):
+        if not self.frame_future.done():
+            self.canvas.after(frame_interval, self.poll_frame)
+            return
+
+        future = self.frame_future
+        self.frame_future = None
+        try:
+            frame = self.frame_rendering + (future.result(),)
+        except Exception as e:
+            logging.exception(e)
+            frame = None
+
+        if Canvas.same_view(frame, self.view):
+            self.frame = frame
+            self.draw_image(self.frame[3])
+        elif frame is not None and not Canvas.same_view(self.frame, self.view):
+            # the view changed while rendering; unless the last frame already shows the current view, the new frame
+            # is shown moved and scaled to it
+            self.frame = frame
+            self.draw_preview()
+
+        if self.frame_request is not None:
+            self.start_rendering()
 
     def redraw_points(self, event=None):
         if graxpert.images.get(ImageTypes.Original) is None:
@@ -495,16 +572,25 @@ class Canvas(CTkFrame):
         color = (int(color[0] * 255), int(color[1] * 255), int(color[2] * 255))
         color = "#%02x%02x%02x" % color
 
-        self.canvas.delete("sample")
         self.canvas.delete("crop")
         rectsize = graxpert.prefs.sample_size
         background_points = graxpert.cmd.app_state.background_points
+        if self.dragged_point is not None and self.clicked_inside_pt_idx < len(background_points):
+            background_points = background_points.copy()
+            background_points[self.clicked_inside_pt_idx] = self.dragged_point
 
-        if graxpert.prefs.display_pts and not self.crop_mode:
-            for point in background_points:
-                corner1 = graxpert.to_canvas_point(point[0] - rectsize, point[1] - rectsize)
-                corner2 = graxpert.to_canvas_point(point[0] + rectsize, point[1] + rectsize)
-                self.canvas.create_rectangle(corner1[0], corner1[1], corner2[0], corner2[1], outline=color, width=2, tags="sample")
+        coords = np.zeros((0, 4))
+        if graxpert.prefs.display_pts and not self.crop_mode and len(background_points) > 0:
+            # canvas coordinates of all boxes at once; the view is only scaled and translated
+            corner1 = np.stack([background_points[:, 0] - rectsize, background_points[:, 1] - rectsize, np.ones(len(background_points))])
+            corner2 = np.stack([background_points[:, 0] + rectsize, background_points[:, 1] + rectsize, np.ones(len(background_points))])
+            coords = np.concatenate([graxpert.mat_affine.dot(corner1)[:2], graxpert.mat_affine.dot(corner2)[:2]]).T
+
+            # only boxes intersecting the viewport are drawn
+            visible = (coords[:, 2] >= 0) & (coords[:, 0] <= self.canvas.winfo_width()) & (coords[:, 3] >= 0) & (coords[:, 1] <= self.canvas.winfo_height())
+            coords = coords[visible]
+
+        self.draw_samples(coords, color)
 
         if self.crop_mode:
             corner1 = graxpert.to_canvas_point(self.startx, self.starty)
@@ -513,6 +599,30 @@ class Canvas(CTkFrame):
             self.canvas.create_oval(corner1[0] - 15, corner1[1] - 15, corner1[0] + 15, corner1[1] + 15, outline=color, width=2, tags="crop")
             self.canvas.create_oval(corner2[0] - 15, corner2[1] - 15, corner2[0] + 15, corner2[1] + 15, outline=color, width=2, tags="crop")
 
+    def draw_samples(self, coords, color):
+        # Updates the pooled sample rectangles to the given canvas coordinates. Only rectangles whose coordinates changed
+        # are touched, so adding, removing or moving a single point costs a few canvas calls
+        if color != self.sample_outline:
+            self.canvas.itemconfigure("sample", outline=color)
+            self.sample_outline = color
+
+        while len(self.sample_items) < len(coords):
+            self.sample_items.append(self.canvas.create_rectangle(0, 0, 0, 0, outline=color, width=2, state=tk.HIDDEN, tags="sample"))
+
+        num_shown = len(coords)
+        num_compared = min(num_shown, self.num_samples_shown)
+        changed = np.flatnonzero(np.any(coords[:num_compared] != self.sample_coords[:num_compared], axis=1))
+        for i in changed:
+            self.canvas.coords(self.sample_items[i], *coords[i])
+        for i in range(num_compared, num_shown):
+            self.canvas.coords(self.sample_items[i], *coords[i])
+            self.canvas.itemconfigure(self.sample_items[i], state=tk.NORMAL)
+        for i in range(num_shown, self.num_samples_shown):
+            self.canvas.itemconfigure(self.sample_items[i], state=tk.HIDDEN)
+
+        self.sample_coords = coords
+        self.num_samples_shown = num_shown
+
     def reset_zoom(self, event=None):
         if graxpert.images.get(self.display_type.get()) is None:
             return
@@ -136,7 +136,7 @@ class AdvancedFrame(RightFrameBase):
         self.sample_color.trace_add("write", lambda a, b, c: eventbus.emit(AppEvents.SAMPLE_COLOR_CHANGED, {"sample_color": self.sample_color.get()}))
 
         # interpolation
-        self.rbf_kernels = ["thin_plate", "quintic", "cubic", "linear"]
+        self.rbf_kernels = ["thin_plate", "quintic", "cubic", "linear", "wendland_c0", "wendland_c2", "wendland_c4"]
         self.rbf_kernel = tk.StringVar()
         self.rbf_kernel.set(graxpert.prefs.RBF_kernel)
         self.rbf_kernel.trace_add("write", lambda a, b, c: eventbus.emit(AppEvents.RBF_KERNEL_CHANGED, {"RBF_kernel": self.rbf_kernel.get()}))
@@ -201,4 +201,10 @@ def test_save_stretched_color(tmp_path, file_type):
     
     assert array_color.shape == img_array.shape
 
-    
\ No newline at end of file
+    
+
+def test_stretch_backend():
+    a = AstroImage(do_update_display=False)
+    a.set_from_file("./tests/test_images/color_32bit.fits", None, None)
+
+    assert np.array_equal(a.stretch(stretch_params, "processes"), a.stretch(stretch_params, "threads"), equal_nan=True)
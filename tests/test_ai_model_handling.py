@@ -0,0 +1,105 @@
+from collections import OrderedDict
+import os
+
+import onnxruntime as ort
+import pytest
+
+from graxpert import ai_model_handling
+from graxpert.ai_model_handling import get_inference_session
+
+
+class StubSession:
+    created = []
+
+    def __init__(self, ai_path, sess_options=None, providers=None):
+        self.ai_path = ai_path
+        StubSession.created.append(ai_path)
+
+
+@pytest.fixture
+def stub_sessions(monkeypatch):
+    StubSession.created = []
+    monkeypatch.setattr(ai_model_handling.ort, "InferenceSession", StubSession)
+    monkeypatch.setattr(ai_model_handling, "cached_inference_sessions", OrderedDict())
+    return StubSession.created
+
+def model_file(tmp_path, name, size=100):
+    path = tmp_path / name
+    path.write_bytes(b"\0" * size)
+    return str(path)
+
+def cached_paths():
+    return [os.path.basename(key[0]) for key in ai_model_handling.cached_inference_sessions]
+
+
+
+def test_session_reused(stub_sessions, tmp_path):
+    path = model_file(tmp_path, "bge.onnx")
+
+    session = get_inference_session(path, ["CPUExecutionProvider"])
+    assert get_inference_session(path, ["CPUExecutionProvider"]) is session
+    assert len(stub_sessions) == 1
+
+    # other providers
+    assert get_inference_session(path, ["CUDAExecutionProvider", "CPUExecutionProvider"]) is not session
+    assert len(stub_sessions) == 2
+
+def test_session_options_key(stub_sessions, tmp_path):
+    path = model_file(tmp_path, "bge.onnx")
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = 2
+    session = get_inference_session(path, ["CPUExecutionProvider"], options)
+    assert get_inference_session(path, ["CPUExecutionProvider"]) is not session
+
+    # options with the same settings give the same session
+    same_options = ort.SessionOptions()
+    same_options.intra_op_num_threads = 2
+    assert get_inference_session(path, ["CPUExecutionProvider"], same_options) is session
+
+    other_options = ort.SessionOptions()
+    other_options.intra_op_num_threads = 3
+    assert get_inference_session(path, ["CPUExecutionProvider"], other_options) is not session
+    assert len(stub_sessions) == 3
+
+def test_session_renewed_on_model_change(stub_sessions, tmp_path):
+    path = model_file(tmp_path, "bge.onnx")
+    session = get_inference_session(path, ["CPUExecutionProvider"])
+
+    # e.g. the model was downloaded again
+    mtime = os.path.getmtime(path)
+    os.utime(path, (mtime + 10, mtime + 10))
+    assert get_inference_session(path, ["CPUExecutionProvider"]) is not session
+    assert len(stub_sessions) == 2
+
+def test_eviction_by_count(stub_sessions, tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_model_handling, "max_cached_inference_sessions", 2)
+    paths = [model_file(tmp_path, name) for name in ["a.onnx", "b.onnx", "c.onnx"]]
+
+    get_inference_session(paths[0], ["CPUExecutionProvider"])
+    get_inference_session(paths[1], ["CPUExecutionProvider"])
+    # a becomes the most recently used session, so b is evicted
+    get_inference_session(paths[0], ["CPUExecutionProvider"])
+    get_inference_session(paths[2], ["CPUExecutionProvider"])
+
+    assert cached_paths() == ["a.onnx", "c.onnx"]
+    get_inference_session(paths[1], ["CPUExecutionProvider"])
+    assert cached_paths() == ["c.onnx", "b.onnx"]
+    assert len(stub_sessions) == 4
+
+def test_eviction_by_size(stub_sessions, tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_model_handling, "max_cached_inference_sessions_bytes", 250)
+    paths = [model_file(tmp_path, name, 100) for name in ["a.onnx", "b.onnx", "c.onnx"]]
+
+    get_inference_session(paths[0], ["CPUExecutionProvider"])
+    get_inference_session(paths[1], ["CPUExecutionProvider"])
+    assert cached_paths() == ["a.onnx", "b.onnx"]
+
+    get_inference_session(paths[2], ["CPUExecutionProvider"])
+    assert cached_paths() == ["b.onnx", "c.onnx"]
+
+    # a model larger than the cap evicts all others, but is kept itself
+    large = model_file(tmp_path, "large.onnx", 1000)
+    session = get_inference_session(large, ["CPUExecutionProvider"])
+    assert cached_paths() == ["large.onnx"]
+    assert get_inference_session(large, ["CPUExecutionProvider"]) is session
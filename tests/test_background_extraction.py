@@ -0,0 +1,133 @@
+from graxpert.background_extraction import auto_downscale_factor, calc_mode_dataset, extract_background, extract_background_ai_batch, max_upsampling_error, reduced_downscale_factor, scale_points
+from astropy.stats import sigma_clipped_stats
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+import cv2
+import graxpert.background_extraction
+import numpy as np
+import pytest
+
+
+rng = np.random.default_rng(42)
+image = (0.2 + 0.01 * rng.standard_normal((120, 160))).astype(np.float32)
+for _ in range(60):
+    sy, sx = rng.integers(0, 120), rng.integers(0, 160)
+    image[max(0, sy - 2) : sy + 3, max(0, sx - 2) : sx + 3] += rng.uniform(0.1, 0.8)
+image[50:53, 70:72] = np.nan
+yy, xx = np.mgrid[0:120:13, 0:160:13]
+x_sub = xx.ravel()
+y_sub = yy.ravel()
+
+
+
+class IdentitySession:
+    # stands in for an onnxruntime.InferenceSession of the AI model; the background is the normalized input itself
+    def __init__(self):
+        self.batch_sizes = []
+
+    def get_providers(self):
+        return ["CPUExecutionProvider"]
+
+    def run(self, output_names, inputs):
+        batch = inputs["gen_input_image"]
+        self.batch_sizes.append(batch.shape[0])
+        return [batch.copy()]
+
+
+def test_calc_mode_dataset():
+    halfsize = 10
+    padded = np.pad(image, halfsize, mode="reflect")
+    expected = np.array([sigma_clipped_stats(padded[y : y + 2 * halfsize, x : x + 2 * halfsize], cenfunc="median", stdfunc="std", grow=4)[1] for x, y in zip(x_sub, y_sub)])
+
+    result = calc_mode_dataset(image, x_sub, y_sub, halfsize)
+    assert_array_almost_equal(result, expected, decimal=7)
+
+def test_auto_downscale_factor():
+    # 16 evaluation pixels per median distance between neighboring samples
+    yy, xx = np.mgrid[0:2000:64, 0:3000:64]
+    assert auto_downscale_factor((2000, 3000), xx.ravel(), yy.ravel()) == 4
+
+    # at most 32
+    yy, xx = np.mgrid[0:4000:1000, 0:6000:1000]
+    assert auto_downscale_factor((4000, 6000), xx.ravel(), yy.ravel()) == 32
+
+    # the shorter side keeps at least 64 pixels
+    yy, xx = np.mgrid[0:300:200, 0:3000:200]
+    assert auto_downscale_factor((300, 3000), xx.ravel(), yy.ravel()) == 4
+
+    # at least 1
+    yy, xx = np.mgrid[0:100:8, 0:100:8]
+    assert auto_downscale_factor((100, 100), xx.ravel(), yy.ravel()) == 1
+
+def test_reduced_downscale_factor():
+    assert reduced_downscale_factor(8, 4 * max_upsampling_error) == 4
+    assert reduced_downscale_factor(8, 1.1 * max_upsampling_error) == 7
+    assert reduced_downscale_factor(2, 100 * max_upsampling_error) == 1
+
+@pytest.mark.parametrize("period, expected_factor", [(300, 4), (200, 2)])
+def test_extract_background_downscale_retry(period, expected_factor):
+    # samples 64 pixels apart give a downscale factor of 4, which is only accurate enough for the slower wave
+    yy, xx = np.mgrid[0:512, 0:512]
+    data = (0.5 + 0.2 * np.sin(2 * np.pi * xx / period) * np.cos(2 * np.pi * yy / (1.2 * period))).astype(np.float32)[:, :, None]
+    points_y, points_x = np.mgrid[32:512:64, 32:512:64]
+    points = np.stack([points_x.ravel(), points_y.ravel(), np.ones(points_x.size)], -1)
+    assert auto_downscale_factor((512, 512), points[:, 0], points[:, 1]) == 4
+
+    def background(downscale_factor):
+        return extract_background(data.copy(), points, "RBF", 0.0, downscale_factor, 5, "thin_plate", 3, "Subtraction", None)
+
+    assert_array_equal(background(None), background(expected_factor))
+    if expected_factor != 4:
+        assert not np.array_equal(background(None), background(4))
+
+def test_scale_points():
+    shape = (400, 600)
+    x_sub = np.array([0, 37, 300, 599])
+    y_sub = np.array([0, 211, 150, 399])
+    x_scaled, y_scaled, shape_scaled = scale_points(x_sub, y_sub, shape, 4)
+
+    assert shape_scaled == (100, 150)
+
+    # the points have the coordinates of their pixels in the grid which cv2.resize upsamples to the full image
+    yy, xx = np.mgrid[0 : shape_scaled[0], 0 : shape_scaled[1]].astype(np.float32)
+    upsampled_x = cv2.resize(xx, dsize=(shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+    upsampled_y = cv2.resize(yy, dsize=(shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+    inside = (x_scaled >= 0) & (x_scaled <= shape_scaled[1] - 1) & (y_scaled >= 0) & (y_scaled <= shape_scaled[0] - 1)
+    assert_array_almost_equal(upsampled_x[y_sub, x_sub][inside], x_scaled[inside], decimal=5)
+    assert_array_almost_equal(upsampled_y[y_sub, x_sub][inside], y_scaled[inside], decimal=5)
+    assert_array_equal(scale_points(x_sub, y_sub, shape, 1)[0], x_sub)
+
+@pytest.mark.parametrize("num_colors", [1, 3])
+def test_extract_background_ai_batch(monkeypatch, num_colors):
+    session = IdentitySession()
+    monkeypatch.setattr(graxpert.background_extraction, "get_inference_session", lambda ai_path, providers: session)
+
+    frames = [(0.1 + 0.2 * i + 0.05 * rng.random((90, 130, num_colors))).astype(np.float32) for i in range(5)]
+    expected = [f.copy() for f in frames]
+    expected_backgrounds = [extract_background(f, None, "AI", 0.1, None, None, None, None, "Subtraction", "model.onnx") for f in expected]
+    assert session.batch_sizes == [1] * 5
+
+    session.batch_sizes = []
+    backgrounds = extract_background_ai_batch(frames, 0.1, "Subtraction", "model.onnx", batch_size=2)
+
+    assert session.batch_sizes == [2, 2, 1]
+    for frame, background, expected_frame, expected_background in zip(frames, backgrounds, expected, expected_backgrounds):
+        assert background.shape == frame.shape
+        assert_array_equal(background, expected_background)
+        assert_array_equal(frame, expected_frame)
+
+@pytest.mark.parametrize("interpolation_type, kriging_neighbors", [("RBF", None), ("Kriging", None), ("Kriging", 12)])
+def test_extract_background_row_blocks(interpolation_type, kriging_neighbors):
+    yy, xx = np.mgrid[0:60, 0:80]
+    data = np.stack([0.3 + 0.001 * xx + 0.002 * yy, 0.2 + 0.003 * xx, 0.4 - 0.002 * yy], -1).astype(np.float32)
+    data += (0.005 * rng.standard_normal(data.shape)).astype(np.float32)
+    points_y, points_x = np.mgrid[5:60:10, 5:80:10]
+    points = np.stack([points_x.ravel(), points_y.ravel(), np.ones(points_x.size)], -1)
+
+    def background(block_size=None, num_workers=None):
+        return extract_background(data.copy(), points, interpolation_type, 0.0, 1, 3, "thin_plate", 3, "Subtraction", None, block_size=block_size, num_workers=num_workers, kriging_neighbors=kriging_neighbors)
+
+    expected = background()
+    assert np.max(np.abs(expected - data)) < 0.05
+    # 60 rows in blocks of 7 leave a shorter last block; a single block for all rows
+    for block_size in [7, 100]:
+        assert_array_equal(background(block_size, 2), expected)
@@ -0,0 +1,42 @@
+from graxpert.astroimage import AstroImage
+from graxpert.background_flood_selection import background_flood_selection
+from PIL import Image
+import numpy as np
+
+
+rng = np.random.default_rng(42)
+yy, xx = np.mgrid[0:300, 0:400]
+data = 0.2 + 0.1 * np.exp(-((xx - 100) ** 2 + (yy - 100) ** 2) / (2 * 80**2))
+data = np.clip(np.stack([data, 0.9 * data, 1.1 * data], -1) + 0.005 * rng.standard_normal((300, 400, 3)), 0, 1).astype(np.float32)
+
+
+
+def create_image():
+    image = AstroImage(do_update_display=False)
+    image.set_from_array(data)
+    image.img_display = Image.fromarray((data * 255).astype(np.uint8))
+    image.img_display_saturated = image.img_display
+    return image
+
+def test_flood_selection():
+    image = create_image()
+    points = background_flood_selection([350, 250, 1], [], 1.0, 20, 5, image)
+
+    assert len(points) > 1
+    # the far corner is flat, the bright region around (100, 100) must not be selected
+    for p in points[1:]:
+        assert (p[0] - 100) ** 2 + (p[1] - 100) ** 2 > 80**2
+
+    # the grid medians are cached in the image and give the same result
+    assert (20, 5) in image.grid_medians
+    points_cached = background_flood_selection([350, 250, 1], [], 1.0, 20, 5, image)
+    assert np.array_equal(np.array(points, dtype=object).tolist(), np.array(points_cached, dtype=object).tolist())
+
+    # no duplicates of existing points
+    assert len(background_flood_selection([350, 250, 1], points[1:], 1.0, 20, 5, image)) == 0
+
+def test_cache_invalidated_on_crop():
+    image = create_image()
+    background_flood_selection([350, 250, 1], [], 1.0, 20, 5, image)
+    image.crop(0, 200, 0, 150)
+    assert len(image.grid_medians) == 0
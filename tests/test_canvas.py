@@ -0,0 +1,141 @@
+from concurrent.futures import Future
+from graxpert.commands import INIT_HANDLER, Command
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+canvas_module = pytest.importorskip("graxpert.ui.canvas")
+Canvas = canvas_module.Canvas
+
+
+class FakeExecutor:
+    # renders only when the test completes the returned future
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.jobs.append((future, args))
+        return future
+
+    def finish(self):
+        future, args = self.jobs.pop(0)
+        display_key, display_pyramid, size, mat_affine = args
+        future.set_result(("frame", tuple(mat_affine[:2, 2])))
+
+
+class FakeTkCanvas:
+    def __init__(self):
+        self.callbacks = []
+
+    def after(self, ms, callback):
+        self.callbacks.append(callback)
+
+    def winfo_width(self):
+        return 200
+
+    def winfo_height(self):
+        return 150
+
+def view(tx, ty):
+    return np.array([[1.0, 0.0, tx], [0.0, 1.0, ty], [0.0, 0.0, 1.0]])
+
+def create_canvas(monkeypatch):
+    image = SimpleNamespace(display_key=(1, None, None), get_display_pyramid=lambda: "pyramid")
+    app = SimpleNamespace(images={"Original": image}, mat_affine=view(0.0, 0.0))
+    monkeypatch.setattr(canvas_module, "graxpert", app)
+
+    canvas = Canvas.__new__(Canvas)
+    canvas.display_type = SimpleNamespace(get=lambda: "Original")
+    canvas.canvas = FakeTkCanvas()
+    canvas.render_executor = FakeExecutor()
+    canvas.tile_cache = SimpleNamespace(render=None)
+    canvas.redraw_scheduled = False
+    canvas.view = None
+    canvas.frame_request = None
+    canvas.frame_rendering = None
+    canvas.frame_future = None
+    canvas.frame = None
+    canvas.drawn = []
+    canvas.redraw_points = lambda: None
+    canvas.draw_image = canvas.drawn.append
+    canvas.draw_preview = lambda: canvas.drawn.append(("preview", tuple(canvas.view[2][:2, 2])))
+    return app, canvas
+
+def move_to(app, canvas, tx, ty):
+    app.mat_affine = view(tx, ty)
+    canvas.render_frame()
+
+def poll(canvas):
+    canvas.canvas.callbacks.clear()
+    canvas.poll_frame()
+
+
+
+def test_render_frame_back_to_shown_view(monkeypatch):
+    app, canvas = create_canvas(monkeypatch)
+
+    move_to(app, canvas, 0.0, 0.0)
+    canvas.render_executor.finish()
+    poll(canvas)
+    assert canvas.drawn[-1] == ("frame", (0.0, 0.0))
+
+    # panning away and back while the other view is rendered
+    move_to(app, canvas, 50.0, 0.0)
+    move_to(app, canvas, 0.0, 0.0)
+    assert canvas.drawn[-1] == ("frame", (0.0, 0.0))
+
+    canvas.render_executor.finish()
+    poll(canvas)
+    assert canvas.drawn[-1] == ("frame", (0.0, 0.0))
+    assert canvas.frame[3] == ("frame", (0.0, 0.0))
+    assert canvas.frame_future is None and len(canvas.render_executor.jobs) == 0
+
+def test_render_frame_view_changed_while_rendering(monkeypatch):
+    app, canvas = create_canvas(monkeypatch)
+
+    move_to(app, canvas, 0.0, 0.0)
+    move_to(app, canvas, 10.0, 0.0)
+    move_to(app, canvas, 20.0, 0.0)
+    # the first view is still rendering, only the last request is kept
+    assert len(canvas.render_executor.jobs) == 1
+
+    canvas.render_executor.finish()
+    poll(canvas)
+    assert canvas.drawn[-1] == ("preview", (20.0, 0.0))
+    assert len(canvas.render_executor.jobs) == 1
+
+    # the frame of the current view is drawn as soon as it is rendered
+    canvas.render_executor.finish()
+    assert canvas.canvas.callbacks == [canvas.poll_frame]
+    poll(canvas)
+    assert canvas.drawn[-1] == ("frame", (20.0, 0.0))
+    assert canvas.frame_future is None
+
+def test_drag_point(monkeypatch):
+    app, canvas = create_canvas(monkeypatch)
+    app.display_type = "Original"
+    app.prefs = SimpleNamespace(display_pts=True, sample_size=10, bg_flood_selection_option=False)
+    app.cmd = Command(INIT_HANDLER, background_points=[np.array([50, 50, 1]), np.array([120, 80, 1])])
+    app.cmd.execute()
+    app.to_image_point = lambda x, y: [float(x), float(y), 1.0]
+    app.to_canvas_point = lambda x, y: [x, y]
+    monkeypatch.setattr(canvas_module.eventbus, "emit", lambda *args: None)
+    canvas.crop_mode = False
+    canvas.dragged_point = None
+
+    canvas.on_mouse_down_left(SimpleNamespace(x=52, y=48, time=0))
+    for t, x in [(10, 60), (20, 70), (30, 80)]:
+        canvas.on_mouse_move_left(SimpleNamespace(x=x, y=55, time=t))
+
+        # while dragging, the app state and its index are unchanged
+        assert app.cmd.app_state.background_points.tolist() == [[50, 50, 1], [120, 80, 1]]
+        assert app.cmd.app_state.point_index.nearest(50, 50, 10) == 0
+        assert app.cmd.app_state.point_index.nearest(x, 55, 5) == -1
+    assert canvas.dragged_point == [80.0, 55.0, 1.0]
+
+    canvas.on_mouse_release_left(SimpleNamespace(x=85, y=55, time=40))
+    assert canvas.dragged_point is None
+    assert app.cmd.app_state.background_points.tolist() == [[85, 55, 1], [120, 80, 1]]
+    assert app.cmd.app_state.point_index.nearest(85, 55, 5) == 0
+    assert app.cmd.app_state.point_index.nearest(50, 50, 5) == -1
@@ -0,0 +1,46 @@
+from argparse import Namespace
+import pytest
+
+cmdline_tools = pytest.importorskip("graxpert.cmdline_tools")
+
+
+def bge_args(**kwargs):
+    args = dict(
+        preferences_file=None,
+        smoothing=None,
+        correction=None,
+        gpu_acceleration=None,
+        ai_batch_size=None,
+        downscale_factor=None,
+        ai_version=None,
+        output=None,
+        bg=False,
+        filename="a.fits",
+        additional_filenames=[],
+    )
+    args.update(kwargs)
+    return Namespace(**args)
+
+def run_bge(monkeypatch, args):
+    calls = []
+    monkeypatch.setattr(cmdline_tools, "ai_model_path_from_version", lambda models_dir, version: "model.onnx")
+    monkeypatch.setattr(cmdline_tools.BGECmdlineTool, "get_ai_version", lambda self, prefs: "1.0.0")
+    monkeypatch.setattr(cmdline_tools.BGECmdlineTool, "execute_ai_batch", lambda self, filenames, prefs, ai_model_path: calls.append(("batch", filenames)))
+    monkeypatch.setattr(cmdline_tools.BGECmdlineTool, "execute_single", lambda self, filename, prefs, downscale_factor, ai_model_path: calls.append(("single", filename)))
+    cmdline_tools.BGECmdlineTool(args).execute()
+    return calls
+
+
+
+def test_bge_chunks(monkeypatch):
+    args = bge_args(ai_batch_size=2, additional_filenames=["b.fits", "c.fits", "d.fits", "e.fits"], output="out")
+    calls = run_bge(monkeypatch, args)
+
+    assert calls == [("batch", ["a.fits", "b.fits"]), ("batch", ["c.fits", "d.fits"]), ("batch", ["e.fits"])]
+    # one output name cannot be used for several images
+    assert args.output is None
+
+def test_bge_single_image(monkeypatch):
+    calls = run_bge(monkeypatch, bge_args(ai_batch_size=2, output="out"))
+
+    assert calls == [("single", "a.fits")]
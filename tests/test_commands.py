@@ -0,0 +1,36 @@
+from graxpert.commands import ADD_POINT_HANDLER, INIT_HANDLER, MOVE_POINT_HANDLER, RESET_POINTS_HANDLER, RM_POINT_HANDLER, Command
+import numpy as np
+
+
+
+def snapshot(cmd):
+    return cmd.app_state.background_points.tolist(), list(cmd.app_state.point_index.points)
+
+def test_undo_redo():
+    cmd = Command(INIT_HANDLER, background_points=[np.array([10, 10, 1]), np.array([100, 100, 1])])
+    cmd.execute()
+    history = [snapshot(cmd)]
+
+    for handler, args in [
+        (ADD_POINT_HANDLER, {"point": np.array([300.5, 200.2, 1.0])}),
+        (RM_POINT_HANDLER, {"idx": 0}),
+        (MOVE_POINT_HANDLER, {"idx": 0, "new_point": np.array([500, 500, 1])}),
+        (MOVE_POINT_HANDLER, {"idx": 1, "new_point": []}),
+        (RESET_POINTS_HANDLER, {}),
+    ]:
+        cmd = Command(handler, cmd, **args)
+        cmd.execute()
+        history.append(snapshot(cmd))
+
+    assert history[1][0] == [[10, 10, 1], [100, 100, 1], [300, 200, 1]]
+    # the last point takes the place of a removed one
+    assert history[2][0] == [[300, 200, 1], [100, 100, 1]]
+    assert cmd.app_state.background_points.dtype == np.int32
+
+    for state in reversed(history[:-1]):
+        cmd = cmd.undo()
+        assert snapshot(cmd) == state
+
+    for state in history[1:]:
+        cmd = cmd.redo()
+        assert snapshot(cmd) == state
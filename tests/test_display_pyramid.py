@@ -0,0 +1,34 @@
+from graxpert.display_pyramid import DisplayPyramid
+from numpy.testing import assert_array_equal
+from PIL import Image
+import numpy as np
+
+
+rng = np.random.default_rng(42)
+image = Image.fromarray(rng.integers(0, 256, (301, 457, 3), dtype=np.uint8))
+
+
+
+def test_render_level_0():
+    pyramid = DisplayPyramid(image)
+
+    for scale, tx, ty in [(1.0, 0.0, 0.0), (2.0, -120.0, -35.0), (3.0, 40.0, 10.0), (1.0, -400.0, -250.0)]:
+        mat_affine = np.array([[scale, 0.0, tx], [0.0, scale, ty], [0.0, 0.0, 1.0]])
+        mat_inv = np.linalg.inv(mat_affine)
+        affine_inv = (mat_inv[0, 0], mat_inv[0, 1], mat_inv[0, 2], mat_inv[1, 0], mat_inv[1, 1], mat_inv[1, 2])
+        expected = image.transform((200, 150), Image.AFFINE, affine_inv, Image.NEAREST)
+
+        assert_array_equal(np.asarray(pyramid.render((200, 150), mat_affine)), np.asarray(expected))
+
+def test_render_reduced():
+    pyramid = DisplayPyramid(image)
+    mat_affine = np.array([[0.25, 0.0, 0.0], [0.0, 0.25, 0.0], [0.0, 0.0, 1.0]])
+
+    assert pyramid.level_index(0.25) == 2
+    assert_array_equal(np.asarray(pyramid.render((115, 76), mat_affine)), np.asarray(image.reduce(2).reduce(2)))
+
+def test_render_outside():
+    pyramid = DisplayPyramid(image)
+    mat_affine = np.array([[1.0, 0.0, 1000.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+
+    assert_array_equal(np.asarray(pyramid.render((50, 40), mat_affine)), np.zeros((40, 50, 3)))
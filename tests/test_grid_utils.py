@@ -0,0 +1,23 @@
+from graxpert.grid_utils import find_darkest_quadrant, find_darkest_quadrants
+from numpy.testing import assert_array_equal
+import numpy as np
+
+
+rng = np.random.default_rng(42)
+image = (0.2 + 0.02 * rng.random((120, 160, 3))).astype(np.float32)
+for _ in range(40):
+    sy, sx = rng.integers(0, 120), rng.integers(0, 160)
+    image[max(0, sy - 3) : sy + 4, max(0, sx - 3) : sx + 4] += 0.5
+image_mono = image @ np.array([0.2125, 0.7154, 0.0721], dtype=np.float32)
+x = rng.integers(0, 160, 200)
+y = rng.integers(0, 120, 200)
+
+
+
+def test_find_darkest_quadrants():
+    pts, medians = find_darkest_quadrants(x, y, image, 10)
+
+    for i in range(len(x)):
+        pt, median = find_darkest_quadrant(x[i], y[i], image_mono, 10)
+        assert_array_equal(pts[i], pt)
+        assert medians[i] == median
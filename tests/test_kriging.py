@@ -0,0 +1,53 @@
+from graxpert.kriging import OrdinaryKrigingInterpolation
+from numpy.testing import assert_array_almost_equal
+from pykrige.ok import OrdinaryKriging
+import numpy as np
+
+
+rng = np.random.default_rng(42)
+points = rng.random((80, 2)) * 200
+values = np.stack([0.2 + 0.001 * points[:, 0], 0.3 + 0.0005 * points[:, 1]], -1) + rng.normal(0, 0.003, (80, 2))
+x_new = np.arange(0, 200, 4.0)
+y_new = np.arange(0, 200, 5.0)
+
+
+
+def test_matches_pykrige():
+    OK = OrdinaryKriging(x=points[:, 0], y=points[:, 1], z=values[:, 0], variogram_model="spherical")
+    result, var = OK.execute("grid", xpoints=x_new, ypoints=y_new, backend="vectorized")
+
+    interp = OrdinaryKrigingInterpolation(points, values[:, 0])
+    xx, yy = np.meshgrid(x_new, y_new)
+    result_interp = interp(np.stack([xx.ravel(), yy.ravel()], -1)).reshape(result.shape)
+
+    assert_array_almost_equal(result_interp, result, decimal=8)
+
+def test_multiple_channels():
+    interp = OrdinaryKrigingInterpolation(points, values)
+
+    assert_array_almost_equal(interp(points), values, decimal=8)
+    assert_array_almost_equal(interp(points, max_bytes=1024), interp(points), decimal=12)
+
+def test_local_kriging():
+    interp = OrdinaryKrigingInterpolation(points, values)
+    interp_local = OrdinaryKrigingInterpolation(points, values, neighbors=40, window=8)
+    assert interp_local.local
+
+    assert_array_almost_equal(interp_local(points), values, decimal=8)
+
+    # inside the sampled area, the local systems give nearly the same result as the global one
+    xx, yy = np.meshgrid(np.arange(40, 160, 3.0), np.arange(40, 160, 3.0))
+    points_inner = np.stack([xx.ravel(), yy.ravel()], -1)
+    result = interp(points_inner)
+    assert np.all(np.max(np.abs(interp_local(points_inner) - result), axis=0) < 0.02 * np.ptp(result, axis=0))
+
+def test_local_kriging_continuity():
+    interp_local = OrdinaryKrigingInterpolation(points, values, neighbors=10, window=16)
+
+    # the neighbor sets change from window to window, but the surface has no steps at the window edges
+    x = np.arange(0, 200, 0.25)
+    for y in [50.3, 100.0, 151.7]:
+        result = interp_local(np.stack([x, np.full_like(x, y)], -1))
+        steps = np.max(np.abs(np.diff(result, axis=0)), axis=1)
+        at_edge = np.isin(x[1:], np.arange(16, 200, 16))
+        assert np.max(steps[at_edge]) < 2 * np.max(steps[~at_edge])
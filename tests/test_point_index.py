@@ -0,0 +1,41 @@
+from graxpert.point_index import PointIndex
+import numpy as np
+
+
+rng = np.random.default_rng(42)
+
+
+
+def brute_force_nearest(points, x, y, max_dist):
+    min_idx = -1
+    min_dist = -1
+    for i, p in enumerate(points):
+        dist = max(abs(p[0] - x), abs(p[1] - y))
+        if min_idx == -1 or dist < min_dist:
+            min_dist = dist
+            min_idx = i
+    return min_idx if min_idx != -1 and min_dist <= max_dist else -1
+
+def test_point_index():
+    points = [rng.integers(0, 1000, 3) for _ in range(300)]
+    index = PointIndex(points)
+
+    for _ in range(100):
+        # the last point takes the place of the removed one
+        idx = int(rng.integers(0, len(points)))
+        points[idx] = points[-1]
+        points.pop()
+        index.remove(idx)
+
+        idx = int(rng.integers(0, len(points)))
+        points[idx] = rng.random(3) * 1000
+        index.move(idx, points[idx])
+
+        points.append(rng.integers(0, 1000, 3))
+        index.add(points[-1])
+
+    assert len(index) == len(points)
+    for _ in range(500):
+        x, y = rng.random(2) * 1000
+        assert index.nearest(x, y, 25) == brute_force_nearest(points, x, y, 25)
+        assert index.query_box(x, y, 50) == [i for i, p in enumerate(points) if abs(p[0] - x) <= 50 and abs(p[1] - y) <= 50]
@@ -0,0 +1,96 @@
+from graxpert.radialbasisinterpolation import RadialBasisInterpolation, cached_factorizations, clear_cached_factorizations
+from numpy.testing import assert_array_almost_equal
+import numpy as np
+import pytest
+import tracemalloc
+
+
+rng = np.random.default_rng(42)
+points = rng.random((60, 2)) * 100
+values = rng.random((60, 3))
+points_new = rng.random((500, 2)) * 100
+
+
+
+def test_interpolation_at_points():
+    interp = RadialBasisInterpolation(points, values[:, 0], kernel="thin_plate")
+
+    assert_array_almost_equal(interp(points), values[:, 0], decimal=5)
+
+@pytest.mark.parametrize("smoothing", [0.0, 0.5])
+def test_multiple_channels(smoothing):
+    smooth = smoothing * np.linalg.norm(values, axis=0) / np.sqrt(len(values))
+    interp = RadialBasisInterpolation(points, values, kernel="thin_plate", smooth=smooth)
+    result = interp(points_new)
+
+    assert result.shape == (500, 3)
+
+    for c in range(3):
+        interp_c = RadialBasisInterpolation(points, values[:, c], kernel="thin_plate", smooth=smooth[c])
+        assert_array_almost_equal(result[:, c], interp_c(points_new), decimal=8)
+
+def test_factorization_cache():
+    clear_cached_factorizations()
+    interp = RadialBasisInterpolation(points, values[:, 0], kernel="thin_plate")
+    assert len(cached_factorizations) == 1
+
+    interp_cached = RadialBasisInterpolation(points, values[:, 1], kernel="thin_plate")
+    assert len(cached_factorizations) == 1
+
+    clear_cached_factorizations()
+    interp_c = RadialBasisInterpolation(points, values[:, 1], kernel="thin_plate")
+    assert_array_almost_equal(interp_cached(points_new), interp_c(points_new), decimal=10)
+
+@pytest.mark.parametrize("kernel", ["wendland_c0", "wendland_c2", "wendland_c4"])
+def test_compact_kernels(kernel):
+    interp = RadialBasisInterpolation(points, values, kernel=kernel, epsilon=30.0)
+
+    assert_array_almost_equal(interp(points), values, decimal=8)
+
+    # the sparse solver must agree with the dense solver for the same kernel
+    wendland = lambda r, epsilon: interp._kernel(r)
+    interp_dense = RadialBasisInterpolation(points, values, kernel=wendland, epsilon=30.0)
+    assert_array_almost_equal(interp(points_new), interp_dense(points_new), decimal=8)
+
+@pytest.mark.parametrize("kernel", ["thin_plate", "cubic"])
+def test_fast_summation(kernel):
+    grid_points = rng.random((400, 2)) * 1000
+    grid_values = np.sin(grid_points[:, 0] / 300) + np.cos(grid_points[:, 1] / 400)
+    xx, yy = np.meshgrid(np.arange(0, 1000, 5.0), np.arange(0, 1000, 5.0))
+    points_grid = np.stack([xx.ravel(), yy.ravel()], -1)
+
+    interp = RadialBasisInterpolation(grid_points, grid_values, kernel=kernel)
+    interp_fast = RadialBasisInterpolation(grid_points, grid_values, kernel=kernel, tol=1e-6)
+    assert interp_fast.fast_summation is not None
+
+    result = interp(points_grid)
+    result_fast = interp_fast(points_grid)
+    assert np.max(np.abs(result_fast - result)) < 1e-5 * np.ptp(result)
+
+def test_evaluation_blocks():
+    interp = RadialBasisInterpolation(points, values, kernel="thin_plate")
+    result = interp(points_new)
+
+    out = np.empty((500, 3), dtype=np.float32)
+    assert interp(points_new, out=out, max_bytes=4096) is out
+    assert interp.block_size(max_bytes=4096) < 500
+    assert_array_almost_equal(out, result, decimal=5)
+
+    result_float32 = interp(points_new, dtype=np.float32)
+    assert result_float32.dtype == np.float32
+    assert_array_almost_equal(result_float32, result, decimal=2)
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+@pytest.mark.parametrize("kernel", ["thin_plate", "gaussian"])
+def test_block_memory_budget(kernel, dtype):
+    interp = RadialBasisInterpolation(rng.random((400, 2)) * 100, rng.random((400, 3)), kernel=kernel)
+    X = rng.random((50000, 2)) * 100
+    out = np.empty((len(X), 3), dtype=np.float32)
+    max_bytes = 4 * 1024**2
+
+    tracemalloc.start()
+    interp(X, out=out, dtype=dtype, max_bytes=max_bytes)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert peak <= 1.1 * max_bytes
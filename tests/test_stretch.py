@@ -0,0 +1,80 @@
+from graxpert.stretch import StretchParameters, calculate_mtf_stretch_parameters_for_image, calculate_mtf_stretch_parameters_from_histograms, channel_histograms, display_stretch, quantize, stretch, stretch_all
+from numpy.testing import assert_array_equal
+import logging
+import numpy as np
+import os
+import pytest
+import time
+
+
+rng = np.random.default_rng(42)
+image = np.clip(rng.normal(0.1, 0.02, (60, 80, 3)) + rng.random((60, 80, 3)) ** 8, 0.0, 1.0).astype(np.float32)
+stretch_params = StretchParameters("20% Bg, 3 sigma")
+
+
+
+def test_display_stretch():
+    mtf_stretch_params = calculate_mtf_stretch_parameters_for_image(stretch_params, image)
+    expected = np.clip(stretch(image.copy(), stretch_params), 0.0, 1.0) * 255
+    display = display_stretch(quantize(image), mtf_stretch_params)
+
+    assert display.dtype == np.uint8
+    assert np.max(np.abs(display - expected)) < 1.5
+
+def test_display_stretch_linked():
+    linked_stretch_params = StretchParameters("20% Bg, 3 sigma", channels_linked=True)
+    mtf_stretch_params = calculate_mtf_stretch_parameters_for_image(linked_stretch_params, image)
+    expected = np.clip(stretch(image.copy(), linked_stretch_params), 0.0, 1.0) * 255
+
+    assert np.max(np.abs(display_stretch(quantize(image), mtf_stretch_params) - expected)) < 1.5
+
+def test_display_no_stretch():
+    assert_array_equal(display_stretch(quantize(np.array([[[0.0, 0.5, 1.0]]])), None), [[[0, 127, 255]]])
+
+def test_channel_histograms():
+    quantized = quantize(image)
+    histograms = channel_histograms(quantized, block_rows=7)
+
+    assert histograms.shape == (3, 65536)
+    for c in range(3):
+        assert_array_equal(histograms[c], np.bincount(quantized[:, :, c].ravel(), minlength=65536))
+
+def test_mtf_stretch_parameters_from_histograms():
+    histograms = channel_histograms(quantize(image))
+
+    for channels_linked in [False, True]:
+        params = StretchParameters("10% Bg, 3 sigma", channels_linked=channels_linked)
+        expected = calculate_mtf_stretch_parameters_for_image(params, image)
+        result = calculate_mtf_stretch_parameters_from_histograms(params, histograms)
+
+        for p, q in zip(result, expected):
+            assert abs(p.shadow_clipping - q.shadow_clipping) < 1e-2
+            assert abs(p.midtone - q.midtone) < 1e-2
+
+def test_stretch_backends():
+    mtf_stretch_params = calculate_mtf_stretch_parameters_for_image(stretch_params, image)
+    expected = stretch_all([image], [mtf_stretch_params], backend="processes")[0]
+    result = stretch_all([image], [mtf_stretch_params], backend="threads")[0]
+
+    assert result is not image
+    assert_array_equal(result, expected)
+
+    in_place = image.copy()
+    stretch_all([in_place], [mtf_stretch_params], backend="threads", in_place=True)
+    assert_array_equal(in_place, expected)
+
+@pytest.mark.skipif(not os.environ.get("GRAXPERT_BENCHMARK"), reason="benchmark, set GRAXPERT_BENCHMARK=1 to run")
+def test_benchmark_stretch_backends():
+    # a 24 MP color frame
+    frame = np.clip(rng.normal(0.1, 0.02, (4000, 6000, 3)) + rng.random((4000, 6000, 3)) ** 20, 0.0, 1.0).astype(np.float32)
+    mtf_stretch_params = calculate_mtf_stretch_parameters_for_image(stretch_params, frame)
+
+    results = {}
+    for backend, in_place in [("processes", False), ("threads", False), ("threads", True)]:
+        data = frame.copy() if in_place else frame
+        start = time.perf_counter()
+        results[(backend, in_place)] = stretch_all([data], [mtf_stretch_params], backend=backend, in_place=in_place)[0]
+        logging.info("stretch_all backend={} in_place={}: {:.2f} s".format(backend, in_place, time.perf_counter() - start))
+
+    assert_array_equal(results[("threads", False)], results[("processes", False)])
+    assert_array_equal(results[("threads", True)], results[("processes", False)])
@@ -0,0 +1,30 @@
+from graxpert.tensor_spline import TensorProductSpline
+from numpy.testing import assert_array_almost_equal
+import numpy as np
+
+
+rng = np.random.default_rng(42)
+x = rng.random(500) * 200
+y = rng.random(500) * 100
+values = np.stack([0.2 + 0.001 * x + 0.0005 * y, 0.1 + 0.01 * np.sin(x / 50)], -1)
+x_new = np.arange(0, 200, 1.0)
+y_new = np.arange(0, 100, 1.0)
+
+
+
+def test_grid_matches_points():
+    interp = TensorProductSpline(x, y, values, ((0, 200), (0, 100)), knots=6, order=3)
+    result = interp.grid(x_new, y_new)
+
+    assert result.shape == (100, 200, 2)
+
+    xx, yy = np.meshgrid(x_new, y_new)
+    result_points = interp(xx.ravel(), yy.ravel()).reshape(result.shape)
+    assert_array_almost_equal(result, result_points, decimal=12)
+
+def test_fit():
+    interp = TensorProductSpline(x, y, values, ((0, 200), (0, 100)), knots=6, order=3)
+
+    # a plane lies in the null space of the difference penalty and is reproduced
+    assert_array_almost_equal(interp(x, y)[:, 0], values[:, 0], decimal=8)
+    assert np.max(np.abs(interp(x, y)[:, 1] - values[:, 1])) < 1e-3
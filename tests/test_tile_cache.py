@@ -0,0 +1,46 @@
+from graxpert.display_pyramid import DisplayPyramid
+from graxpert.tile_cache import TileCache
+from numpy.testing import assert_array_equal
+from PIL import Image
+import numpy as np
+
+
+rng = np.random.default_rng(42)
+image = Image.fromarray(rng.integers(0, 256, (301, 457, 3), dtype=np.uint8))
+pyramid = DisplayPyramid(image)
+
+
+
+def test_render_matches_pyramid():
+    cache = TileCache(tile_size=64)
+
+    for scale, tx, ty in [(1.0, 0.0, 0.0), (2.0, -130.0, -35.0), (0.5, 20.0, 10.0), (1.0, -400.0, -250.0)]:
+        mat_affine = np.array([[scale, 0.0, tx], [0.0, scale, ty], [0.0, 0.0, 1.0]])
+        expected = pyramid.render((200, 150), mat_affine)
+
+        assert_array_equal(np.asarray(cache.render("key", pyramid, (200, 150), mat_affine)), np.asarray(expected))
+        # from the cached tiles
+        assert_array_equal(np.asarray(cache.render("key", pyramid, (200, 150), mat_affine)), np.asarray(expected))
+
+def test_reuse():
+    cache = TileCache(tile_size=64)
+    mat_affine = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+    cache.render("key", pyramid, (128, 128), mat_affine)
+    assert len(cache) == 4
+
+    # panning by a tile needs two new tiles
+    mat_affine[0, 2] = -64
+    cache.render("key", pyramid, (128, 128), mat_affine)
+    assert len(cache) == 6
+
+    cache.render("other", pyramid, (128, 128), mat_affine)
+    assert len(cache) == 10
+
+def test_eviction():
+    cache = TileCache(budget=3 * 64 * 64 * 3, tile_size=64)
+    mat_affine = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+    cache.render("key", pyramid, (128, 128), mat_affine)
+
+    assert len(cache) == 3
+    assert cache.nbytes == 3 * 64 * 64 * 3
+    assert ("key", 1.0, 0, 0) not in cache.tiles